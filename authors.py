@@ -0,0 +1,87 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+import os
+from cache import TTLCache
+from database import db, read_db
+
+AUTHOR_CACHE_SIZE = int(os.getenv("AUTHOR_CACHE_SIZE", "50000"))
+# Names are served from here for up to this long after a profile change in another worker
+AUTHOR_CACHE_TTL_SECONDS = float(os.getenv("AUTHOR_CACHE_TTL_SECONDS", "10"))
+
+# user id -> display name, shared by every request in this worker
+author_cache = TTLCache(maxsize=AUTHOR_CACHE_SIZE, ttl=AUTHOR_CACHE_TTL_SECONDS)
+
+_NOT_FOUND = object()
+
+
+def display_name(user) -> str:
+    return user.get("full_name") or user.get("username")
+
+
+def invalidate(user_id: str):
+    author_cache.pop(user_id)
+
+
+class AuthorLoader:
+    """Per-request batch loader: resolves every user id it is asked for with one $in query.
+
+    With primary=True names are read from the primary and author_cache is
+    skipped, for responses that are cached under the current version.
+    """
+
+    def __init__(self, primary: bool = False):
+        self._names = {}
+        self.primary = primary
+
+    async def load_many(self, user_ids) -> dict:
+        missing = []
+        for user_id in set(user_ids):
+            if user_id in self._names:
+                continue
+            name = _NOT_FOUND if self.primary else author_cache.get(user_id, _NOT_FOUND)
+            if name is _NOT_FOUND:
+                missing.append(user_id)
+            else:
+                self._names[user_id] = name
+        object_ids = []
+        for user_id in missing:
+            try:
+                object_ids.append(ObjectId(user_id))
+            except (InvalidId, TypeError):
+                self._names[user_id] = None
+        if object_ids:
+            found = {}
+            source = db if self.primary else read_db
+            async for user in source["users"].find({"_id": {"$in": object_ids}}, {"full_name": 1, "username": 1}):
+                found[str(user["_id"])] = display_name(user)
+            for oid in object_ids:
+                user_id = str(oid)
+                # Deleted users are cached as None so the embedded name is kept
+                self._names[user_id] = found.get(user_id)
+                author_cache.set(user_id, self._names[user_id])
+        return {user_id: self._names.get(user_id) for user_id in user_ids}
+
+
+def _refs(doc):
+    author = doc.get("author")
+    if isinstance(author, dict):
+        yield author
+    for tag in doc.get("tags") or []:
+        if isinstance(tag, dict):
+            yield tag
+    for reply in doc.get("replies") or []:
+        if isinstance(reply, dict):
+            yield from _refs(reply)
+
+
+async def hydrate(docs, loader: AuthorLoader = None, primary: bool = False):
+    """Replace the embedded author/tag names on docs with current ones, in place."""
+    refs = [ref for doc in docs for ref in _refs(doc) if ref.get("_id")]
+    if not refs:
+        return docs
+    names = await (loader or AuthorLoader(primary)).load_many([str(ref["_id"]) for ref in refs])
+    for ref in refs:
+        name = names.get(str(ref["_id"]))
+        if name:
+            ref["name"] = name
+    return docs
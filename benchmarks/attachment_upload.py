@@ -0,0 +1,175 @@
+"""Throughput and server memory while uploading large attachments concurrently.
+
+Streams --uploads distinct files of --size-mb each, --concurrency at a
+time, to POST /attachments of a running server, then downloads them back
+and checks the sha256. With --server-pid the server's resident memory is
+sampled from /proc throughout, which should stay flat however large the
+files are (Linux only):
+
+    uvicorn main:app --port 8000 &
+    python benchmarks/attachment_upload.py --username user0 --password testpassword \\
+        --size-mb 500 --concurrency 4 --server-pid $!
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from loadgen import Connection, form_body
+
+BOUNDARY = "benchmark-boundary-7MA4YWxkTrZu0gW"
+BLOCK = 1024 * 1024
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class MemorySampler:
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.baseline = self.peak = rss_mb(pid) if pid else 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, rss_mb(self.pid))
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        if self.pid:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        if self._task:
+            self._task.cancel()
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+
+async def upload(base_url: str, auth: dict, index: int, size: int) -> tuple:
+    """Stream one file without ever holding it in memory; returns (response json, local sha256)."""
+    parts = urlsplit(base_url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="bench{index}.bin"\r\n'
+            f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    lines = [
+        "POST /attachments HTTP/1.1",
+        f"Host: {parts.hostname}:{parts.port or 80}",
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}",
+        f"Content-Length: {len(head) + size + len(tail)}",
+        "Connection: close",
+    ] + [f"{k}: {v}" for k, v in auth.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + head)
+    # Distinct content per upload, so dedup does not short-circuit the benchmark
+    block = hashlib.sha256(str(index).encode()).digest() * (BLOCK // 32)
+    digest = hashlib.sha256()
+    sent = 0
+    while sent < size:
+        data = block[:size - sent]
+        digest.update(data)
+        writer.write(data)
+        await writer.drain()
+        sent += len(data)
+    writer.write(tail)
+    await writer.drain()
+    status, headers = await read_response(reader)
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    writer.close()
+    if status != 201:
+        raise RuntimeError(f"upload {index}: HTTP {status} {body[:200]!r}")
+    return json.loads(body), digest.hexdigest()
+
+
+async def download(base_url: str, url: str) -> tuple:
+    parts = urlsplit(base_url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    writer.write(f"GET {url} HTTP/1.1\r\nHost: {parts.hostname}\r\nConnection: close\r\n\r\n".encode())
+    status, headers = await read_response(reader)
+    digest = hashlib.sha256()
+    remaining = int(headers.get("content-length", 0))
+    while remaining:
+        data = await reader.read(min(remaining, BLOCK))
+        if not data:
+            break
+        digest.update(data)
+        remaining -= len(data)
+    writer.close()
+    return status, digest.hexdigest()
+
+
+async def run_phase(label, calls, concurrency, total_bytes, sampler):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with sem:
+            return await call()
+
+    start = time.perf_counter()
+    with sampler:
+        results = await asyncio.gather(*(one(call) for call in calls))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10}{total_bytes / 2**20 / elapsed:>10.1f} MB/s{elapsed:>10.1f} s"
+          f"   server RSS {sampler.baseline:.0f} MB -> peak {sampler.peak:.0f} MB")
+    return results
+
+
+async def run(args):
+    conn = Connection(args.base_url)
+    headers, body = form_body({"username": args.username, "password": args.password})
+    status, _, data = await conn.request("POST", "/auth/login", headers=headers, body=body)
+    conn.close()
+    if status != 200:
+        raise SystemExit(f"Login failed: HTTP {status}")
+    auth = {"Authorization": f"Bearer {json.loads(data)['access_token']}"}
+    size = int(args.size_mb * 2**20)
+    total = size * args.uploads
+
+    print(f"{args.uploads} x {args.size_mb} MB, {args.concurrency} concurrent")
+    uploads = await run_phase("upload", [lambda i=i: upload(args.base_url, auth, i, size) for i in range(args.uploads)],
+                              args.concurrency, total, MemorySampler(args.server_pid))
+    downloads = await run_phase("download", [lambda r=r: download(args.base_url, r["url"]) for r, _ in uploads],
+                                args.concurrency, total, MemorySampler(args.server_pid))
+    ok = True
+    for (result, local), (status, remote) in zip(uploads, downloads):
+        if not (result["sha256"] == local == remote and status == 200):
+            print(f"MISMATCH {result['id']}: local {local} stored {result['sha256']} downloaded {remote} (HTTP {status})")
+            ok = False
+    print("all digests match" if ok else "FAILED")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--size-mb", type=float, default=500)
+    parser.add_argument("--uploads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--server-pid", type=int, help="Sample this process's RSS (the uvicorn worker)")
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
@@ -0,0 +1,72 @@
+"""Measure non-auth endpoint latency while /auth/login is being hammered.
+
+Runs two phases against a running server: a baseline where only the probe
+endpoint is polled, then the same probe load while login workers send
+bcrypt-heavy requests concurrently. Compare the probe p99 between phases
+(and between PASSWORD_HASH_* settings on the server).
+
+    uvicorn main:app --port 8000 &
+    python benchmarks/auth_load.py --username johndoe --password testpassword
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from loadgen import Connection, Recorder, form_body
+
+
+async def probe_worker(base_url, path, recorder, deadline):
+    conn = Connection(base_url)
+    while time.perf_counter() < deadline:
+        await recorder.timed(conn.request("GET", path))
+    conn.close()
+
+
+async def login_worker(base_url, username, password, recorder, deadline):
+    conn = Connection(base_url)
+    headers, body = form_body({"username": username, "password": password})
+    while time.perf_counter() < deadline:
+        await recorder.timed(conn.request("POST", "/auth/login", headers=headers, body=body))
+    conn.close()
+
+
+async def phase(args, with_logins: bool) -> dict:
+    deadline = time.perf_counter() + args.duration
+    probes = Recorder("probe")
+    logins = Recorder("login")
+    tasks = [probe_worker(args.base_url, args.probe_path, probes, deadline) for _ in range(args.probe_concurrency)]
+    if with_logins:
+        tasks += [login_worker(args.base_url, args.username, args.password, logins, deadline) for _ in range(args.login_concurrency)]
+    await asyncio.gather(*tasks)
+    probes.stop()
+    logins.stop()
+    result = {"probe": probes.summary()}
+    if with_logins:
+        result["login"] = logins.summary()
+    return result
+
+
+async def main(args):
+    report = {
+        "probe_path": args.probe_path,
+        "baseline": await phase(args, with_logins=False),
+        "under_login_load": await phase(args, with_logins=True),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--probe-path", default="/posts/?limit=20")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per phase")
+    parser.add_argument("--probe-concurrency", type=int, default=8)
+    parser.add_argument("--login-concurrency", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
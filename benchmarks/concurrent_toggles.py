@@ -0,0 +1,88 @@
+"""Concurrency check for the atomic like/save toggle.
+
+Fires thousands of parallel toggles at a single post on a local mongod, in
+two phases:
+
+- ordered: each user's own toggles are issued in order (as clicks from one
+  client would be) while all users race each other. The final reactions and
+  likesCount must be exactly the set of users that toggled an odd number of
+  times.
+- bursts: each user's toggles are also fired at once (double clicks), so one
+  toggle can meet the reaction another is inserting or deleting. Which state
+  wins is not defined, but likesCount must still equal the stored reactions
+  and no user may hold more than one.
+
+Run from the repo root:
+
+    python benchmarks/concurrent_toggles.py --uri mongodb://localhost:27017
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+import reactions
+from indexes import ensure_indexes
+from reactions import LIKE, toggle_reaction
+
+
+async def run(uri: str, users: int, toggles: int, concurrency: int):
+    client = AsyncIOMotorClient(uri, maxPoolSize=concurrency)
+    db = client["bench_toggles"]
+    reactions.db = db
+    await client.drop_database("bench_toggles")
+    await ensure_indexes(db)
+    user_ids = [f"user{i}" for i in range(users)]
+    plan = [random.choice(user_ids) for _ in range(toggles)]
+    sem = asyncio.Semaphore(concurrency)
+
+    async def toggle(post_id, user_id):
+        async with sem:
+            await toggle_reaction(db["posts"], post_id, LIKE, user_id)
+
+    async def ordered(post_id, user_id, times):
+        for _ in range(times):
+            await toggle(post_id, user_id)
+
+    async def burst(post_id, user_id, times):
+        await asyncio.gather(*(toggle(post_id, user_id) for _ in range(times)))
+
+    ok = True
+    for label, clicks, exact in (("ordered", ordered, True), ("bursts", burst, False)):
+        post_id = (await db["posts"].insert_one({"title": f"hot post ({label})", "likesCount": 0})).inserted_id
+        start = time.perf_counter()
+        await asyncio.gather(*(clicks(post_id, u, plan.count(u)) for u in user_ids))
+        elapsed = time.perf_counter() - start
+
+        post = await db["posts"].find_one({"_id": post_id})
+        likers = [r["user_id"] async for r in db["reactions"].find({"target": post_id, "kind": LIKE})]
+        consistent = post["likesCount"] == len(likers) == len(set(likers))
+        if exact:
+            expected = {u for u in user_ids if plan.count(u) % 2 == 1}
+            phase_ok = consistent and set(likers) == expected
+            detail = f"expected: {len(expected)}"
+        else:
+            phase_ok = consistent
+            detail = "counter must match the stored reactions"
+        ok = ok and phase_ok
+        print(f"{label:<8} {toggles} toggles over {users} users in {elapsed:.2f}s ({toggles / elapsed:.0f} ops/s)")
+        print(f"         final likers: {len(likers)}, likesCount: {post['likesCount']}, {detail} -> {'OK' if phase_ok else 'MISMATCH'}")
+    await client.drop_database("bench_toggles")
+    client.close()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--toggles", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.uri, args.users, args.toggles, args.concurrency))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,170 @@
+"""Generate a large synthetic dataset with realistic skew for load testing.
+
+A few power users write most posts, a few hot posts collect most comments
+and likes, and every counter on posts/comments matches the generated
+comments and reactions. All users share the password "testpassword" and
+are named user0, user1, ... so the load test can log in as any of them.
+
+    python benchmarks/generate_data.py --uri mongodb://localhost:27017 --db collab_nest_bench \\
+        --users 100000 --posts 1000000 --comments 10000000 --drop
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from passlib.context import CryptContext
+from indexes import ensure_indexes
+from user_search import search_terms
+
+PASSWORD = "testpassword"
+CATEGORIES = ["notes", "jobs", "events", "projects", "questions", "resources"]
+FIRST = ["John", "Jane", "Alex", "Priya", "Rahul", "Maria", "Li", "Sam", "Fatima", "Noah", "Olivia", "Arjun", "Neeru", "Sai"]
+LAST = ["Doe", "Smith", "Kim", "Patel", "Sharma", "Garcia", "Chen", "Khan", "Brown", "Nguyen", "Reddy", "Meda"]
+WORDS = ("study notes exam javascript react python mongodb fastapi project team hiring referral internship "
+         "workshop hackathon deadline assignment lecture tutorial resume interview placement semester lab").split()
+BATCH_SIZE = 5000
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def skewed(n: int, skew: float) -> int:
+    # Power-law pick in [0, n): low indexes are "hot" (skew=1 is uniform)
+    return min(n - 1, int(n * random.random() ** skew))
+
+
+def sentence(words: int) -> str:
+    return " ".join(random.choices(WORDS, k=words)).capitalize()
+
+
+async def insert_batches(collection, docs_iter, total: int, label: str):
+    start = time.perf_counter()
+    batch, done = [], 0
+    for doc in docs_iter:
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            await collection.insert_many(batch, ordered=False)
+            done += len(batch)
+            batch = []
+            rate = done / (time.perf_counter() - start)
+            print(f"\r{label}: {done}/{total} ({rate:,.0f} docs/s)", end="", flush=True)
+    if batch:
+        await collection.insert_many(batch, ordered=False)
+        done += len(batch)
+    print(f"\r{label}: {done}/{total} in {time.perf_counter() - start:.1f}s" + " " * 20)
+
+
+def plan(args):
+    """Pre-sample every skewed choice so counters can be written with the documents."""
+    comment_posts = array("I", (skewed(args.posts, args.skew) for _ in range(args.comments)))
+    comments_per_post = array("I", bytes(4 * args.posts))
+    for p in comment_posts:
+        comments_per_post[p] += 1
+    # Pareto-distributed likes: most posts get a handful, a few viral ones get tens of thousands
+    cap = min(args.users, args.max_likes)
+    likes_per_post = array("I", (min(cap, int(random.paretovariate(args.like_alpha)) - 1) for _ in range(args.posts)))
+    return comment_posts, comments_per_post, likes_per_post
+
+
+def user_docs(args, user_ids, hashed):
+    for i, user_id in enumerate(user_ids):
+        full_name = f"{random.choice(FIRST)} {random.choice(LAST)}"
+        username = f"user{i}"
+        yield {
+            "_id": user_id,
+            "username": username,
+            "email": f"{username}@example.com",
+            "full_name": full_name,
+            "password": hashed,
+            "department": random.choice(["CSE", "ECE", "MECH", "CIVIL", "IT"]),
+            "joined": START + timedelta(minutes=i),
+            "search_terms": search_terms(username, full_name),
+        }
+
+
+def post_docs(args, user_ids, names, post_ids, comments_per_post, likes_per_post):
+    for i, post_id in enumerate(post_ids):
+        author = skewed(args.users, args.skew)
+        tags = [skewed(args.users, args.skew) for _ in range(random.randint(0, 2))]
+        yield {
+            "_id": post_id,
+            "title": sentence(random.randint(3, 8)),
+            "content": sentence(random.randint(20, 80)),
+            "category": random.choice(CATEGORIES),
+            "attachments": [],
+            "tags": [{"_id": str(user_ids[t]), "name": names[t]} for t in tags],
+            "author": {"_id": user_ids[author], "name": names[author]},
+            # Posts are spread over a year, oldest first
+            "createdAt": START + timedelta(seconds=i * 31_536_000 // max(1, args.posts)),
+            "commentsCount": comments_per_post[i],
+            "likesCount": likes_per_post[i],
+            "savesCount": 0,
+        }
+
+
+def comment_docs(args, user_ids, names, post_ids, comment_posts):
+    for p in comment_posts:
+        author = skewed(args.users, args.skew)
+        yield {
+            "content": sentence(random.randint(5, 30)),
+            "author": {"_id": user_ids[author], "name": names[author]},
+            "createdAt": START + timedelta(seconds=random.randint(0, 31_536_000)),
+            "likesCount": 0,
+            "replies": [],
+            "post_id": post_ids[p],
+        }
+
+
+def reaction_docs(args, user_ids, post_ids, likes_per_post):
+    now = datetime.now(timezone.utc)
+    for i, count in enumerate(likes_per_post):
+        for u in random.sample(range(args.users), count):
+            yield {"user_id": str(user_ids[u]), "target": post_ids[i], "kind": "like", "createdAt": now}
+
+
+async def generate(args):
+    random.seed(args.seed)
+    client = AsyncIOMotorClient(args.uri)
+    db = client[args.db]
+    if args.drop:
+        await client.drop_database(args.db)
+
+    print("Sampling skewed distributions...")
+    comment_posts, comments_per_post, likes_per_post = plan(args)
+    user_ids = [ObjectId() for _ in range(args.users)]
+    post_ids = [ObjectId() for _ in range(args.posts)]
+    # One hash for everybody: bcrypt per user would dominate generation time
+    hashed = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(PASSWORD)
+
+    users = list(user_docs(args, user_ids, hashed))
+    names = [u["full_name"] for u in users]
+    await insert_batches(db["users"], iter(users), args.users, "users")
+    await insert_batches(db["posts"], post_docs(args, user_ids, names, post_ids, comments_per_post, likes_per_post), args.posts, "posts")
+    await insert_batches(db["comments"], comment_docs(args, user_ids, names, post_ids, comment_posts), args.comments, "comments")
+    await insert_batches(db["reactions"], reaction_docs(args, user_ids, post_ids, likes_per_post), sum(likes_per_post), "reactions")
+    print("Building indexes...")
+    await ensure_indexes(db)
+    client.close()
+    print("Done")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="collab_nest_bench")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    parser.add_argument("--comments", type=int, default=10_000_000)
+    parser.add_argument("--max-likes", type=int, default=50_000, help="Upper bound on likes for any single post")
+    parser.add_argument("--like-alpha", type=float, default=1.2, help="Pareto shape for likes per post (lower = heavier tail)")
+    parser.add_argument("--skew", type=float, default=3.0, help="1 = uniform; higher concentrates activity on hot posts/power users")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--drop", action="store_true", help="Drop the target database first")
+    asyncio.run(generate(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""Like/save throughput on a single hot post, with and without the write-behind buffer.
+
+Fires --toggles concurrent toggles from --users users at one post in a
+scratch database on a local mongod, once through reactions.toggle_reaction
+and once through reaction_buffer.ReactionBuffer, then checks that
+likesCount matches the stored reactions in both cases:
+
+    python benchmarks/hot_post_writes.py --uri mongodb://localhost:27017 --toggles 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+import reaction_buffer
+import reactions
+import response_cache
+from indexes import ensure_indexes
+from reactions import LIKE, toggle_reaction
+
+DB_NAME = "bench_hot_post"
+
+
+async def run_mode(db, label, toggle, plan, concurrency, finish=None):
+    await db["reactions"].delete_many({})
+    post_id = (await db["posts"].insert_one({"title": "viral", "likesCount": 0})).inserted_id
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(user_id):
+        async with sem:
+            await toggle(db["posts"], post_id, LIKE, user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(user_id) for user_id in plan))
+    if finish:
+        await finish()
+    elapsed = time.perf_counter() - start
+    stored = await db["reactions"].count_documents({"target": post_id, "kind": LIKE})
+    count = (await db["posts"].find_one({"_id": post_id}))["likesCount"]
+    status = "OK" if stored == count else "MISMATCH"
+    print(f"{label:<12}{len(plan) / elapsed:>12,.0f} toggles/s   likesCount={count} reactions={stored} {status}")
+    return stored == count
+
+
+async def run(args):
+    client = AsyncIOMotorClient(args.uri, maxPoolSize=args.concurrency)
+    db = client[DB_NAME]
+    # Point the modules at the scratch database
+    reactions.db = reaction_buffer.db = response_cache.db = db
+    await client.drop_database(DB_NAME)
+    await ensure_indexes(db)
+    random.seed(1)
+    plan = [f"user{random.randrange(args.users)}" for _ in range(args.toggles)]
+
+    ok = await run_mode(db, "direct", toggle_reaction, plan, args.concurrency)
+    buffer = reaction_buffer.ReactionBuffer(flush_ms=args.flush_ms, flush_ops=args.flush_ops)
+    buffer.start()
+    ok &= await run_mode(db, "buffered", buffer.toggle, plan, args.concurrency, finish=buffer.stop)
+    await client.drop_database(DB_NAME)
+    client.close()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--toggles", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--flush-ms", type=float, default=reaction_buffer.REACTION_FLUSH_MS)
+    parser.add_argument("--flush-ops", type=int, default=reaction_buffer.REACTION_FLUSH_OPS)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(run(args)) else 1)
@@ -0,0 +1,178 @@
+"""Scenario-based load test with a JSON report that can be compared between commits.
+
+Point it at a running server backed by a generated dataset (see
+generate_data.py). Each scenario runs for --duration seconds at
+--concurrency, and the throughput and p50/p95/p99 of every scenario are
+written to --output:
+
+    uvicorn main:app --port 8000 --workers 4 &
+    python benchmarks/load_test.py --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from loadgen import Connection, Recorder, form_body
+
+SEARCH_WORDS = ["notes", "react", "python", "hiring", "internship", "hackathon", "exam", "mongodb"]
+NAME_PREFIXES = ["jo", "ja", "pri", "rah", "ma", "al", "sa", "ne", "user1"]
+
+
+class Context:
+    """Shared state gathered once before the scenarios run."""
+
+    def __init__(self, args):
+        self.args = args
+        self.sessions = []  # (user id, auth headers)
+        self.post_ids = []
+
+    async def setup(self):
+        conn = Connection(self.args.base_url)
+        for i in range(self.args.sessions):
+            headers, body = form_body({"username": f"user{i}", "password": self.args.password})
+            status, _, data = await conn.request("POST", "/auth/login", headers=headers, body=body)
+            if status != 200:
+                continue
+            auth = {"Authorization": f"Bearer {json.loads(data)['access_token']}"}
+            status, _, data = await conn.request("GET", "/auth/me", headers=auth)
+            self.sessions.append((json.loads(data)["id"], auth))
+        cursor = None
+        for _ in range(self.args.feed_pages):
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            status, headers, data = await conn.request("GET", "/posts/", params=params)
+            self.post_ids += [p["id"] for p in json.loads(data)]
+            cursor = headers.get("x-next-cursor")
+            if not cursor:
+                break
+        conn.close()
+        if not self.sessions or not self.post_ids:
+            raise SystemExit("Setup failed: could not log in or the feed is empty (did you run generate_data.py?)")
+
+    def hot_post(self):
+        # Recent posts get most of the traffic
+        return self.post_ids[min(len(self.post_ids) - 1, int(len(self.post_ids) * random.random() ** 3))]
+
+
+async def feed(ctx, conn, rec):
+    cursor = None
+    for _ in range(random.randint(1, 5)):
+        params = {"limit": 20, **({"cursor": cursor} if cursor else {})}
+        result = await rec.timed(conn.request("GET", "/posts/", params=params))
+        cursor = result and result[1].get("x-next-cursor")
+        if not cursor:
+            break
+
+
+async def post_detail(ctx, conn, rec):
+    post_id = ctx.hot_post()
+    await rec.timed(conn.request("GET", f"/posts/{post_id}"))
+    await rec.timed(conn.request("GET", f"/comments/post/{post_id}", params={"limit": 20}))
+
+
+async def like_toggle(ctx, conn, rec):
+    user_id, auth = random.choice(ctx.sessions)
+    body = json.dumps({"user_id": user_id}).encode()
+    await rec.timed(conn.request("POST", f"/posts/{ctx.hot_post()}/like", headers={**auth, "Content-Type": "application/json"}, body=body))
+
+
+async def login(ctx, conn, rec):
+    headers, body = form_body({"username": f"user{random.randrange(ctx.args.sessions)}", "password": ctx.args.password})
+    await rec.timed(conn.request("POST", "/auth/login", headers=headers, body=body))
+
+
+async def search(ctx, conn, rec):
+    if random.random() < 0.5:
+        await rec.timed(conn.request("GET", "/search", params={"q": random.choice(SEARCH_WORDS), "limit": 20}))
+    else:
+        await rec.timed(conn.request("GET", "/users/search", params={"q": random.choice(NAME_PREFIXES)}))
+
+
+SCENARIOS = {
+    "feed": feed,
+    "post_detail": post_detail,
+    "like_toggle": like_toggle,
+    "login": login,
+    "search": search,
+}
+
+
+async def run_scenario(ctx, name, duration, concurrency) -> dict:
+    rec = Recorder(name)
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        conn = Connection(ctx.args.base_url)
+        while time.perf_counter() < deadline:
+            await SCENARIOS[name](ctx, conn, rec)
+        conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    rec.stop()
+    return rec.summary()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: dict, baseline: dict):
+    print(f"\n{'scenario':<14}{'metric':<16}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, current in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = before.get(metric), current.get(metric)
+            change = f"{(new - old) / old * 100:+.1f}%" if old and new is not None else "n/a"
+            print(f"{name:<14}{metric:<16}{old!s:>12}{new!s:>12}{change:>10}")
+
+
+async def main(args):
+    random.seed(args.seed)
+    ctx = Context(args)
+    await ctx.setup()
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "duration_s": args.duration,
+        "concurrency": args.concurrency,
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        print(f"running {name}...", file=sys.stderr)
+        report["scenarios"][name] = await run_scenario(ctx, name, args.duration, args.concurrency)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--password", default="testpassword")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--sessions", type=int, default=50, help="Generated users to log in as (user0..userN-1)")
+    parser.add_argument("--feed-pages", type=int, default=10, help="Feed pages of post ids to sample targets from")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to diff against")
+    asyncio.run(main(parser.parse_args()))
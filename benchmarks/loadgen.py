@@ -0,0 +1,118 @@
+"""Minimal keep-alive HTTP/1.1 client and latency stats for the benchmark scripts.
+
+Pure asyncio so the load generator has no dependencies beyond the stdlib.
+"""
+import asyncio
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+class Connection:
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.reader = None
+        self.writer = None
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, headers: dict = None, body: bytes = b"", params: dict = None):
+        """Send one request and return (status, response headers, body bytes)."""
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        if self.writer is None:
+            await self._connect()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        try:
+            await self.writer.drain()
+            status_line = await self.reader.readline()
+            if not status_line:
+                raise ConnectionError("connection closed by server")
+            status = int(status_line.split()[1])
+            resp_headers = {}
+            while True:
+                line = await self.reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                resp_headers[name.strip().lower()] = value.strip()
+            if resp_headers.get("transfer-encoding") == "chunked":
+                data = await self._read_chunked()
+            else:
+                data = await self.reader.readexactly(int(resp_headers.get("content-length", 0)))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        if resp_headers.get("connection") == "close":
+            self.close()
+        return status, resp_headers, data
+
+    async def _read_chunked(self):
+        data = b""
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return data
+            data += await self.reader.readexactly(size)
+            await self.reader.readline()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def form_body(fields: dict) -> tuple:
+    return {"Content-Type": "application/x-www-form-urlencoded"}, urlencode(fields).encode()
+
+
+class Recorder:
+    """Collects per-request latencies and status codes for one scenario."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    async def timed(self, coro):
+        start = time.perf_counter()
+        try:
+            status, headers, body = await coro
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        return status, headers, body
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        lat = sorted(self.latencies)
+        return {
+            "requests": len(lat),
+            "errors": self.errors,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "throughput_rps": round(len(lat) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": percentile_ms(lat, 50),
+            "p95_ms": percentile_ms(lat, 95),
+            "p99_ms": percentile_ms(lat, 99),
+            "max_ms": round(lat[-1] * 1000, 2) if lat else None,
+        }
+
+
+def percentile_ms(sorted_latencies, pct):
+    if not sorted_latencies:
+        return None
+    index = min(len(sorted_latencies) - 1, int(round(pct / 100 * (len(sorted_latencies) - 1))))
+    return round(sorted_latencies[index] * 1000, 2)
@@ -0,0 +1,88 @@
+"""Compare response_model validation with the fast serialization path on a list_posts page.
+
+No database needed: pages are built from synthetic Mongo documents with the
+same helpers list_posts uses, then serialized three ways:
+
+  validate+json      validate against List[Post], then stdlib json.dumps
+  validate+dump_json validate against List[Post], then pydantic's dump_json
+  fast               serialization.dumps on the helper output (orjson if installed)
+
+    python benchmarks/serialization.py --page-size 500 --rounds 200
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DB_NAME", "benchmark")
+
+from bson import ObjectId
+from pydantic import TypeAdapter
+import serialization
+from models import Post
+from routers.post import post_helper
+
+WORDS = "study notes exam javascript react python mongodb fastapi project team hiring internship".split()
+
+
+def fake_post(i: int) -> dict:
+    author = {"_id": str(ObjectId()), "name": f"User {i % 97}"}
+    return {
+        "_id": ObjectId(),
+        "title": " ".join(random.choices(WORDS, k=6)),
+        "content": " ".join(random.choices(WORDS, k=60)),
+        "category": random.choice(["notes", "jobs", "events"]),
+        "attachments": [],
+        "tags": [author] * random.randint(0, 2),
+        "author": author,
+        "createdAt": f"2024-05-{i % 28 + 1:02d}T10:00:00Z",
+        "commentsCount": random.randint(0, 50),
+        "likesCount": random.randint(0, 500),
+        "savesCount": random.randint(0, 50),
+    }
+
+
+def page(docs) -> list:
+    # What list_posts hands to the serializer (with_viewer_flags for an anonymous viewer)
+    return [{**post_helper(doc), "likedByMe": False, "savedByMe": False} for doc in docs]
+
+
+def time_path(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+
+def main(args):
+    random.seed(1)
+    content = page([fake_post(i) for i in range(args.page_size)])
+    adapter = TypeAdapter(List[Post])
+
+    paths = {
+        "validate+json": lambda: json.dumps(adapter.dump_python(adapter.validate_python(content), mode="json")).encode(),
+        "validate+dump_json": lambda: adapter.dump_json(adapter.validate_python(content)),
+        "fast": lambda: serialization.dumps(content),
+    }
+    reference = json.loads(paths["validate+json"]())
+    for name, fn in paths.items():
+        # Same JSON either way, otherwise the comparison is meaningless
+        assert json.loads(fn()) == reference, f"{name} output differs"
+
+    print(f"{args.page_size} posts/page, {args.rounds} rounds, orjson={'yes' if serialization.orjson else 'no'}")
+    baseline = None
+    for name, fn in paths.items():
+        per_page = time_path(fn, args.rounds)
+        baseline = baseline or per_page
+        print(f"{name:<20}{per_page * 1000:>9.2f} ms/page{baseline / per_page:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=200)
+    main(parser.parse_args())
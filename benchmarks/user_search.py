@@ -0,0 +1,100 @@
+"""Compare the old unanchored $regex user search with the indexed prefix search.
+
+Generates synthetic users in a scratch database on a local mongod (1M by
+default), then times both query shapes for a set of typeahead prefixes.
+
+    python benchmarks/user_search.py --uri mongodb://localhost:27017 --users 1000000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from indexes import ensure_indexes
+from user_search import MAX_CANDIDATES, prefix_query, rank, search_terms
+from loadgen import percentile_ms
+
+FIRST = ["john", "jane", "alex", "priya", "rahul", "maria", "li", "sam", "fatima", "noah", "olivia", "arjun"]
+LAST = ["doe", "smith", "kim", "patel", "sharma", "garcia", "chen", "khan", "brown", "nguyen", "reddy", "meda"]
+BATCH_SIZE = 10000
+
+
+def fake_user(i: int) -> dict:
+    full_name = f"{random.choice(FIRST).title()} {random.choice(LAST).title()}"
+    username = full_name.replace(" ", "").lower() + str(i)
+    return {
+        "username": username,
+        "email": f"{username}@example.com",
+        "full_name": full_name,
+        "search_terms": search_terms(username, full_name),
+    }
+
+
+async def populate(db, count: int):
+    existing = await db["users"].estimated_document_count()
+    for start in range(existing, count, BATCH_SIZE):
+        await db["users"].insert_many([fake_user(i) for i in range(start, min(count, start + BATCH_SIZE))], ordered=False)
+        print(f"\rinserted {min(count, start + BATCH_SIZE)}/{count} users", end="", flush=True)
+    print()
+
+
+async def regex_search(db, q):
+    return await db["users"].find({
+        "$or": [
+            {"username": {"$regex": q, "$options": "i"}},
+            {"full_name": {"$regex": q, "$options": "i"}}
+        ]
+    }).limit(10).to_list(length=10)
+
+
+async def prefix_search(db, q):
+    candidates = await db["users"].find(prefix_query(q), {"username": 1, "full_name": 1}).limit(MAX_CANDIDATES).to_list(length=MAX_CANDIDATES)
+    candidates.sort(key=lambda user: rank(user, q))
+    return candidates[:10]
+
+
+async def time_queries(db, search, queries) -> dict:
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        await search(db, q)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {"queries": len(latencies), "p50_ms": percentile_ms(latencies, 50), "p99_ms": percentile_ms(latencies, 99), "max_ms": percentile_ms(latencies, 100)}
+
+
+async def main(args):
+    client = AsyncIOMotorClient(args.uri)
+    db = client[args.db]
+    await populate(db, args.users)
+    await ensure_indexes(db)
+    # Typeahead traffic: growing prefixes of real names plus some misses
+    names = FIRST + LAST
+    queries = [random.choice(names)[:random.randint(2, 5)] for _ in range(args.queries)]
+    queries += ["".join(random.choices(string.ascii_lowercase, k=3)) for _ in range(args.queries // 10)]
+    report = {
+        "users": await db["users"].estimated_document_count(),
+        "regex": await time_queries(db, regex_search, queries),
+        "prefix_index": await time_queries(db, prefix_search, queries),
+    }
+    print(json.dumps(report, indent=2))
+    if args.drop:
+        await client.drop_database(args.db)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="bench_user_search")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--drop", action="store_true", help="Drop the scratch database afterwards")
+    asyncio.run(main(parser.parse_args()))
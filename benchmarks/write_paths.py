@@ -0,0 +1,119 @@
+"""Round trips and latency of the old check-then-write paths vs. ownership-filtered atomic writes.
+
+Runs each shape against a scratch database on a local mongod, counting the
+commands actually sent with a pymongo CommandListener:
+
+    python benchmarks/write_paths.py --uri mongodb://localhost:27017 --ops 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, monitoring
+from pymongo.errors import DuplicateKeyError
+from indexes import ensure_indexes
+from loadgen import percentile_ms
+
+DB_NAME = "bench_write_paths"
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        if event.command_name in ("find", "insert", "update", "delete", "findAndModify"):
+            self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def old_update(db, post_id, user_id):
+    existing = await db["posts"].find_one({"_id": post_id})
+    if existing["author"]["_id"] != user_id:
+        raise RuntimeError("forbidden")
+    await db["posts"].update_one({"_id": post_id}, {"$set": {"title": "edited"}})
+    return await db["posts"].find_one({"_id": post_id})
+
+
+async def new_update(db, post_id, user_id):
+    return await db["posts"].find_one_and_update(
+        {"_id": post_id, "author._id": user_id},
+        {"$set": {"title": "edited"}},
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def old_delete(db, post_id, user_id):
+    existing = await db["posts"].find_one({"_id": post_id})
+    if existing["author"]["_id"] != user_id:
+        raise RuntimeError("forbidden")
+    await db["posts"].delete_one({"_id": post_id})
+
+
+async def new_delete(db, post_id, user_id):
+    return await db["posts"].find_one_and_delete({"_id": post_id, "author._id": user_id}, projection={"_id": 1})
+
+
+async def old_register(db, i):
+    if await db["users"].find_one({"username": f"user{i}"}):
+        raise RuntimeError("taken")
+    if await db["users"].find_one({"email": f"user{i}@example.com"}):
+        raise RuntimeError("taken")
+    await db["users"].insert_one({"username": f"user{i}", "email": f"user{i}@example.com"})
+
+
+async def new_register(db, i):
+    try:
+        await db["users"].insert_one({"username": f"user{i}", "email": f"user{i}@example.com"})
+    except DuplicateKeyError:
+        raise RuntimeError("taken")
+
+
+async def measure(counter, label, calls):
+    counter.count = 0
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"{label:<18}{counter.count / len(calls):>12.1f}{percentile_ms(latencies, 50):>10}{percentile_ms(latencies, 95):>10}")
+
+
+async def run(args):
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(args.uri, event_listeners=[counter])
+    db = client[DB_NAME]
+    await client.drop_database(DB_NAME)
+    await ensure_indexes(db)
+    user_id = str(ObjectId())
+    result = await db["posts"].insert_many([{"title": "t", "author": {"_id": user_id}} for _ in range(args.ops * 2)])
+    ids = result.inserted_ids
+
+    print(f"{'path':<18}{'round trips':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    await measure(counter, "update (old)", [lambda p=p: old_update(db, p, user_id) for p in ids[:args.ops]])
+    await measure(counter, "update (new)", [lambda p=p: new_update(db, p, user_id) for p in ids[:args.ops]])
+    await measure(counter, "delete (old)", [lambda p=p: old_delete(db, p, user_id) for p in ids[:args.ops]])
+    await measure(counter, "delete (new)", [lambda p=p: new_delete(db, p, user_id) for p in ids[args.ops:]])
+    await measure(counter, "register (old)", [lambda i=i: old_register(db, i) for i in range(args.ops)])
+    await measure(counter, "register (new)", [lambda i=i: new_register(db, i) for i in range(args.ops, args.ops * 2)])
+    await client.drop_database(DB_NAME)
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--ops", type=int, default=2000, help="Operations per path")
+    asyncio.run(run(parser.parse_args()))
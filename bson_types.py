@@ -0,0 +1,58 @@
+"""Stored vs. API forms of dates and id references.
+
+createdAt/joined are stored as BSON dates and post_id/author._id as
+ObjectIds; the API keeps exchanging strings. Documents written before
+migrations.py ran still hold the string forms, so everything here accepts
+either, and id_match() finds a reference in both forms.
+"""
+from datetime import datetime, timezone
+from bson import ObjectId
+
+
+def to_datetime(value):
+    """Stored form of a date: aware UTC datetime. Strings that are not ISO 8601 are returned as-is."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        # Naive values (Motor's default when reading) are UTC
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def to_iso(value):
+    """API form of a date: UTC with millisecond precision and a Z suffix, as JS toISOString() writes it."""
+    value = to_datetime(value)
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    return value
+
+
+def to_object_id(value):
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return value
+
+
+def id_match(value):
+    """Query value matching a reference stored either as a string or as an ObjectId."""
+    if ObjectId.is_valid(value):
+        return {"$in": [str(value), ObjectId(value)]}
+    return value
+
+
+def stored_ref(ref):
+    # {_id, name} author/tag references
+    if isinstance(ref, dict) and "_id" in ref:
+        return {**ref, "_id": to_object_id(ref["_id"])}
+    return ref
+
+
+def public_ref(ref):
+    if isinstance(ref, dict) and isinstance(ref.get("_id"), ObjectId):
+        return {**ref, "_id": str(ref["_id"])}
+    return ref
@@ -1,14 +1,118 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+import asyncio
+import importlib.util
+import logging
 import os
 from dotenv import load_dotenv
+from metrics import mongo_command_metrics, mongo_pool_metrics
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME")
 
-client = AsyncIOMotorClient(MONGODB_URI)
-db = client[DB_NAME]
+# Pool settings are per process: with N uvicorn workers the server sees N times these numbers
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+# Tried in order; zstd and snappy are only offered when zstandard/python-snappy are installed
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+# Read preference for read-only routes (feed, listings, search)
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "secondaryPreferred")
+# Connections opened with pings at startup so the first requests don't pay for the handshake
+MONGO_WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS", str(max(1, MONGO_MIN_POOL_SIZE))))
+
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+_READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+_client = None
+
+
+def available_compressors() -> list:
+    names = [name.strip() for name in MONGO_COMPRESSORS.split(",") if name.strip()]
+    return [name for name in names if name in _COMPRESSOR_MODULES and importlib.util.find_spec(_COMPRESSOR_MODULES[name])]
+
+
+def client_options() -> dict:
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        # Command and pool monitoring feed /metrics
+        "event_listeners": [mongo_command_metrics, mongo_pool_metrics],
+    }
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+    return options
+
+
+def get_client() -> AsyncIOMotorClient:
+    # Created lazily so scripts work without the app lifespan; the app calls connect() explicitly
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(MONGODB_URI, **client_options())
+    return _client
+
+
+async def connect():
+    client = get_client()
+    # Each concurrent ping checks out its own connection, pre-filling the pool
+    results = await asyncio.gather(
+        *(client.admin.command("ping") for _ in range(MONGO_WARMUP_CONNECTIONS)),
+        return_exceptions=True,
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        logger.warning("MongoDB warmup: %d of %d pings failed: %s", len(failures), len(results), failures[0])
+    else:
+        logger.info("MongoDB connected", extra={"warm_connections": len(results), "compressors": available_compressors()})
+    return client
+
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+class _Database:
+    """Stand-in for the Motor database that always targets the current client."""
+
+    def __init__(self, read_preference=None):
+        self._read_preference = read_preference
+        self._cached = (None, None)
+
+    def _database(self):
+        client = get_client()
+        cached_client, database = self._cached
+        if cached_client is not client:
+            database = client[DB_NAME]
+            if self._read_preference is not None:
+                database = database.with_options(read_preference=self._read_preference)
+            self._cached = (client, database)
+        return database
+
+    def __getitem__(self, name):
+        return self._database()[name]
+
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+
+
+db = _Database()
+# For routes that only read; may be served by secondaries
+read_db = _Database(_READ_PREFERENCES[MONGO_READ_PREFERENCE])
 
 def get_database():
     return db
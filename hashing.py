@@ -0,0 +1,77 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt releases the GIL, so threads are enough by default; "process" isolates it fully
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Calls allowed to wait for a free worker before new ones are rejected with 503
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(PASSWORD_HASH_WORKERS * 4)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = None
+_in_flight = 0
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+
+async def _run(func, *args):
+    global _in_flight
+    if _in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        # Fail fast instead of letting a login burst queue up behind bcrypt
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    loop = asyncio.get_running_loop()
+    future = get_executor().submit(func, *args)
+    _in_flight += 1
+    # Released when the pool is done with the call, not when the caller stops waiting:
+    # a disconnected client's bcrypt run still occupies a worker
+    future.add_done_callback(lambda _: loop.call_soon_threadsafe(_release))
+    return await asyncio.wrap_future(future)
+
+
+async def hash_password(password):
+    return await _run(_hash, password)
+
+
+async def verify_password(plain_password, hashed_password):
+    return await _run(_verify, plain_password, hashed_password)
+
+
+def pool_stats() -> dict:
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "in_flight": _in_flight,
+    }
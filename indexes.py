@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Every index the routers rely on. Created idempotently at startup (see main.lifespan).
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # Multikey index over normalized username/full-name prefixes for /users/search
+        IndexModel([("search_terms", ASCENDING)], name="search_terms"),
+    ],
+    "posts": [
+        IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)], name="createdAt_id"),
+        IndexModel([("category", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="category_createdAt_id"),
+        IndexModel([("author._id", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="author_createdAt_id"),
+        IndexModel([("title", TEXT), ("content", TEXT), ("tags.name", TEXT)], name="posts_text", weights={"title": 5, "tags.name": 3, "content": 1}),
+    ],
+    "comments": [
+        # Also serves the post_id-only lookups (per-post counts, cascades)
+        IndexModel([("post_id", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)], name="post_id_createdAt_id"),
+        IndexModel([("author._id", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="author_createdAt_id"),
+        IndexModel([("content", TEXT)], name="comments_text"),
+    ],
+    "reactions": [
+        # One like/save per user per target; also serves the per-page "did I react" lookup
+        IndexModel([("user_id", ASCENDING), ("target", ASCENDING), ("kind", ASCENDING)], name="user_target_kind", unique=True),
+        IndexModel([("target", ASCENDING), ("kind", ASCENDING)], name="target_kind"),
+        # Per-user saved/liked listings, most recent first
+        IndexModel([("user_id", ASCENDING), ("kind", ASCENDING), ("collection", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)], name="user_kind_collection_createdAt_id"),
+    ],
+    "jobs": [
+        # Claiming: queued jobs by run_at, and running jobs whose lease expired
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="status_locked_until"),
+    ],
+    # GridFS creates its own files/chunks indexes on first upload; this one finds duplicates
+    "attachments.files": [
+        IndexModel([("metadata.sha256", ASCENDING), ("length", ASCENDING)], name="sha256_length"),
+    ],
+}
+
+# References are matched in both id forms until migrations.py has run (bson_types.id_match)
+_ID = ObjectId()
+
+# Representative shape of each query issued by the routers: (collection, filter, sort)
+QUERY_PATTERNS = {
+    "posts.list_posts": ("posts", {}, [("createdAt", -1), ("_id", -1)]),
+    "posts.list_posts?category": ("posts", {"category": "notes"}, [("createdAt", -1), ("_id", -1)]),
+    "posts.list_posts?author": ("posts", {"author._id": {"$in": [str(_ID), _ID]}}, [("createdAt", -1), ("_id", -1)]),
+    "posts.reacted_posts": ("posts", {"_id": {"$in": [ObjectId()]}}, None),
+    "users.user_posts": ("posts", {"author._id": {"$in": [str(_ID), _ID]}}, [("createdAt", -1), ("_id", -1)]),
+    "posts.get_post": ("posts", {"_id": ObjectId()}, None),
+    "comments.list_comments": ("comments", {"post_id": {"$in": [str(_ID), _ID]}}, [("createdAt", 1), ("_id", 1)]),
+    "comments.list_user_comments": ("comments", {"author._id": {"$in": [str(_ID), _ID]}}, [("createdAt", -1), ("_id", -1)]),
+    "comments.list_replies": ("comments", {"_id": ObjectId()}, None),
+    "comments.commentsCount": ("comments", {"post_id": {"$in": ["post"]}}, None),
+    "auth.login": ("users", {"username": "user"}, None),
+    "auth.register": ("users", {"email": "user@example.com"}, None),
+    "auth.get_current_user": ("users", {"_id": ObjectId()}, None),
+    "users.search_users": ("users", {"search_terms": {"$regex": "^jo"}}, None),
+    "search.posts": ("posts", {"$text": {"$search": "notes"}}, None),
+    "search.comments": ("comments", {"$text": {"$search": "notes"}}, None),
+    "reactions.reactions_by_user": ("reactions", {"user_id": "user", "target": {"$in": [ObjectId()]}}, None),
+    "reactions.reacted_page": ("reactions", {"user_id": "user", "kind": "save", "collection": {"$in": ["posts", None]}}, [("createdAt", -1), ("_id", -1)]),
+    "jobs.claim": ("jobs", {"status": "queued", "run_at": {"$lte": datetime.now(timezone.utc)}}, [("run_at", 1)]),
+    "jobs.cascade_post": ("comments", {"post_id": {"$in": [str(_ID), _ID]}}, None),
+    "jobs.cascade_user": ("reactions", {"user_id": "user"}, None),
+    "attachments.dedup": ("attachments.files", {"metadata.sha256": "digest", "length": 1}, [("uploadDate", 1), ("_id", 1)]),
+    "reactions.delete_reactions": ("reactions", {"target": {"$in": [ObjectId()]}}, None),
+}
+
+
+def _key(key) -> tuple:
+    # IndexModel keys are dicts, index_information() keys are lists of pairs
+    pairs = key.items() if hasattr(key, "items") else key
+    return tuple((field, int(d) if isinstance(d, (int, float)) else d) for field, d in pairs)
+
+
+async def missing_indexes(db) -> dict:
+    missing = {}
+    for collection, models in INDEXES.items():
+        info = await db[collection].index_information()
+        existing = {_key(spec["key"]) for spec in info.values()}
+        # Text indexes are stored under _fts/_ftsx keys, so those only match by name
+        names = [m.document["name"] for m in models if m.document["name"] not in info and _key(m.document["key"]) not in existing]
+        if names:
+            missing[collection] = names
+    return missing
+
+
+async def ensure_indexes(db):
+    for collection, names in (await missing_indexes(db)).items():
+        logger.warning("Missing indexes on %s: %s (creating)", collection, ", ".join(names))
+    for collection, models in INDEXES.items():
+        # create_indexes is a no-op for indexes that already exist with the same spec
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate usernames blocking a unique index; keep serving, but say so loudly
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+
+def _stages(plan):
+    yield plan.get("stage")
+    for child in [plan.get("inputStage"), plan.get("queryPlan")] + plan.get("inputStages", []):
+        if child:
+            yield from _stages(child)
+
+
+async def check_query_plans(db) -> list:
+    """Return the names of router queries whose winning plan is a COLLSCAN."""
+    collscans = []
+    for name, (collection, query, sort) in QUERY_PATTERNS.items():
+        cursor = db[collection].find(query).limit(20)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain())["queryPlanner"]["winningPlan"]
+        stages = [s for s in _stages(plan) if s]
+        if "COLLSCAN" in stages:
+            collscans.append(name)
+        print(f"{'COLLSCAN' if 'COLLSCAN' in stages else 'ok':8} {name}: {' <- '.join(stages)}")
+    return collscans
+
+
+async def main(check: bool):
+    from database import db
+    if not check:
+        await ensure_indexes(db)
+        print("Indexes are up to date")
+        return 0
+    missing = await missing_indexes(db)
+    for collection, names in missing.items():
+        print(f"missing  {collection}: {', '.join(names)}")
+    collscans = await check_query_plans(db)
+    if missing or collscans:
+        print(f"FAILED: {len(collscans)} collection scans, {sum(map(len, missing.values()))} missing indexes")
+        return 1
+    print("All router queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create the indexes used by the routers")
+    parser.add_argument("--check", action="store_true", help="Only explain() each router query and fail on COLLSCAN or missing indexes")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.check)))
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from authors import display_name
+from bson_types import id_match
+from database import db
+from reactions import COUNTER_FIELDS
+import realtime
+import response_cache
+
+logger = logging.getLogger(__name__)
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+JOBS_BATCH_SIZE = int(os.getenv("JOBS_BATCH_SIZE", "500"))
+# Pause between batches so a big cascade never saturates the primary
+JOBS_BATCH_PAUSE_MS = float(os.getenv("JOBS_BATCH_PAUSE_MS", "50"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+JOBS_RETRY_SECONDS = float(os.getenv("JOBS_RETRY_SECONDS", "10"))
+# A running job whose lease expires (crashed worker) is picked up again
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "60"))
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "5"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+HANDLERS = {}
+_workers = []
+_wake = None
+
+
+def handler(name: str):
+    """Register an async handler(job, **params). Handlers must be safe to re-run from the start."""
+    def register(func):
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+async def enqueue(job_type: str, **params) -> ObjectId:
+    now = _now()
+    result = await db["jobs"].insert_one({
+        "type": job_type,
+        "params": params,
+        "status": QUEUED,
+        "attempts": 0,
+        "progress": {},
+        "run_at": now,
+        "createdAt": now,
+        "updatedAt": now,
+    })
+    if _wake is not None:
+        _wake.set()
+    return result.inserted_id
+
+
+class Job:
+    def __init__(self, doc: dict, worker: str):
+        self.doc = doc
+        self.id = doc["_id"]
+        self.worker = worker
+
+    async def progress(self, **counts):
+        """Record progress, renew the lease and rate-limit before the next batch."""
+        now = _now()
+        await db["jobs"].update_one(
+            {"_id": self.id, "worker": self.worker},
+            {
+                "$inc": {f"progress.{key}": value for key, value in counts.items()},
+                "$set": {"locked_until": now + timedelta(seconds=JOBS_LEASE_SECONDS), "updatedAt": now},
+            },
+        )
+        await asyncio.sleep(JOBS_BATCH_PAUSE_MS / 1000)
+
+
+async def batches(collection: str, query: dict, projection: dict = None):
+    """Yield chunks of matching docs; each chunk must stop matching once processed."""
+    while True:
+        docs = await db[collection].find(query, projection or {"_id": 1}).limit(JOBS_BATCH_SIZE).to_list(length=JOBS_BATCH_SIZE)
+        if not docs:
+            return
+        yield docs
+
+
+async def _delete_comments(job, query: dict) -> dict:
+    """Delete matching comments with their reactions; returns {post_id: comments removed}."""
+    removed = {}
+    async for docs in batches("comments", query, {"post_id": 1}):
+        ids = [doc["_id"] for doc in docs]
+        await db["reactions"].delete_many({"target": {"$in": ids}})
+        await db["comments"].delete_many({"_id": {"$in": ids}})
+        for doc in docs:
+            removed[doc.get("post_id")] = removed.get(doc.get("post_id"), 0) + 1
+        await job.progress(comments=len(ids))
+    return removed
+
+
+async def _delete_post_contents(job, post_id: str):
+    await _delete_comments(job, {"post_id": id_match(post_id)})
+    async for docs in batches("reactions", {"target": ObjectId(post_id)}):
+        await db["reactions"].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        await job.progress(reactions=len(docs))
+
+
+@handler("cascade_post")
+async def cascade_post(job, post_id: str):
+    """Comments, comment reactions and likes/saves of a deleted post."""
+    await _delete_post_contents(job, post_id)
+    await response_cache.bump(response_cache.POSTS)
+
+
+@handler("cascade_user")
+async def cascade_user(job, user_id: str):
+    """Everything a deleted user leaves behind: posts (with their threads), comments and reactions."""
+    async for docs in batches("posts", {"author._id": id_match(user_id)}):
+        for doc in docs:
+            await _delete_post_contents(job, str(doc["_id"]))
+        await db["posts"].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        # Pages cached since delete_user's bump may still list these posts
+        await response_cache.bump(response_cache.POSTS)
+        for doc in docs:
+            realtime.notify("posts", "delete", str(doc["_id"]))
+        await job.progress(posts=len(docs))
+
+    # Rows are deleted before counters are decremented, so a retry never decrements twice
+    removed = await _delete_comments(job, {"author._id": id_match(user_id)})
+    ops = [UpdateOne({"_id": ObjectId(post_id)}, {"$inc": {"commentsCount": -count}})
+           for post_id, count in removed.items() if post_id and ObjectId.is_valid(post_id)]
+    for i in range(0, len(ops), JOBS_BATCH_SIZE):
+        await db["posts"].bulk_write(ops[i:i + JOBS_BATCH_SIZE], ordered=False)
+    if ops:
+        await response_cache.bump(response_cache.POSTS)
+
+    async for docs in batches("reactions", {"user_id": user_id}, {"target": 1, "kind": 1, "collection": 1}):
+        await db["reactions"].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        counter_ops = {}
+        for doc in docs:
+            # Reactions from before "collection" was recorded may be on either
+            for collection in [doc["collection"]] if doc.get("collection") else ["posts", "comments"]:
+                counter_ops.setdefault(collection, []).append(
+                    UpdateOne({"_id": doc["target"]}, {"$inc": {COUNTER_FIELDS[doc["kind"]]: -1}}))
+        for collection, collection_ops in counter_ops.items():
+            await db[collection].bulk_write(collection_ops, ordered=False)
+        await response_cache.bump(response_cache.POSTS)
+        await job.progress(reactions=len(docs))
+
+
+@handler("propagate_author_name")
+async def propagate_author_name(job, user_id: str):
+    """Rewrite the embedded author/tag/reply names of user_id to the current one."""
+    # Read now rather than passed in, so an older rename job can never win
+    user = await db["users"].find_one({"_id": ObjectId(user_id)}, {"full_name": 1, "username": 1})
+    if user is None:
+        return
+    name = display_name(user)
+    author_id = id_match(user_id)
+    targets = [
+        ("posts", {"author._id": author_id, "author.name": {"$ne": name}}, {"author.name": name}, None),
+        ("posts", {"tags": {"$elemMatch": {"_id": user_id, "name": {"$ne": name}}}}, {"tags.$[t].name": name}, [{"t._id": user_id}]),
+        ("comments", {"author._id": author_id, "author.name": {"$ne": name}}, {"author.name": name}, None),
+        ("comments", {"replies": {"$elemMatch": {"author._id": author_id, "author.name": {"$ne": name}}}}, {"replies.$[r].author.name": name}, [{"r.author._id": author_id}]),
+    ]
+    for collection, query, update, array_filters in targets:
+        async for docs in batches(collection, query):
+            await db[collection].update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}},
+                {"$set": update},
+                array_filters=array_filters,
+            )
+            await job.progress(**{collection: len(docs)})
+
+
+async def claim(worker: str):
+    now = _now()
+    return await db["jobs"].find_one_and_update(
+        {"$or": [
+            {"status": QUEUED, "run_at": {"$lte": now}},
+            {"status": RUNNING, "locked_until": {"$lt": now}},
+        ]},
+        {
+            "$set": {"status": RUNNING, "worker": worker, "locked_until": now + timedelta(seconds=JOBS_LEASE_SECONDS), "updatedAt": now},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def run_job(doc: dict, worker: str):
+    func = HANDLERS.get(doc["type"])
+    try:
+        if func is None:
+            raise ValueError(f"Unknown job type {doc['type']!r}")
+        await func(Job(doc, worker), **doc.get("params", {}))
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back instead of waiting for the lease to expire
+        await db["jobs"].update_one({"_id": doc["_id"], "worker": worker}, {"$set": {"status": QUEUED, "run_at": _now()}, "$inc": {"attempts": -1}})
+        raise
+    except Exception as e:
+        attempts = doc.get("attempts", 1)
+        if attempts >= JOBS_MAX_ATTEMPTS:
+            update = {"status": FAILED}
+            logger.exception("Job failed permanently", extra={"job_id": str(doc["_id"]), "job_type": doc["type"], "attempts": attempts})
+        else:
+            delay = JOBS_RETRY_SECONDS * 2 ** (attempts - 1)
+            update = {"status": QUEUED, "run_at": _now() + timedelta(seconds=delay)}
+            logger.warning("Job failed, retrying in %.0fs: %s", delay, e, extra={"job_id": str(doc["_id"]), "job_type": doc["type"]})
+        await db["jobs"].update_one({"_id": doc["_id"]}, {"$set": {**update, "error": repr(e), "updatedAt": _now()}})
+        return
+    await db["jobs"].update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"status": DONE, "finishedAt": _now(), "updatedAt": _now()}, "$unset": {"locked_until": "", "error": ""}},
+    )
+    logger.info("Job done", extra={"job_id": str(doc["_id"]), "job_type": doc["type"]})
+
+
+async def _work(worker: str):
+    while True:
+        try:
+            doc = await claim(worker)
+        except Exception:
+            logger.exception("Could not claim a job")
+            doc = None
+        if doc is not None:
+            try:
+                await run_job(doc, worker)
+            except Exception:
+                # The status write failed; the job is claimed again once its lease runs out
+                logger.exception("Could not record job outcome", extra={"job_id": str(doc["_id"]), "job_type": doc["type"]})
+            continue
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=JOBS_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start(workers: int = JOBS_WORKERS):
+    global _wake
+    if _workers:
+        return
+    _wake = asyncio.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(workers):
+        _workers.append(asyncio.create_task(_work(f"{prefix}:{i}")))
+
+
+async def stop():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+async def show(status: str = None, limit: int = 20):
+    query = {"status": status} if status else {}
+    async for doc in db["jobs"].find(query).sort("createdAt", -1).limit(limit):
+        print(f"{doc['_id']}  {doc['type']:<22}{doc['status']:<8} attempts={doc.get('attempts', 0)} "
+              f"progress={doc.get('progress', {})} {doc.get('error', '')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List background jobs and their progress")
+    parser.add_argument("--status", choices=[QUEUED, RUNNING, DONE, FAILED])
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(show(args.status, args.limit))
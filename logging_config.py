@@ -0,0 +1,98 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per-logger overrides, e.g. "routers.post=DEBUG,indexes=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Fraction of DEBUG records kept; a call can override it with extra={"sample_rate": ...}
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "request_id", "sample_rate", "asctime"}
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request id and drops unsampled DEBUG records before they are queued."""
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG:
+            rate = getattr(record, "sample_rate", LOG_DEBUG_SAMPLE_RATE)
+            if rate < 1 and random.random() >= rate:
+                return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging():
+    """Route all logging through a queue so handlers never write from the event loop."""
+    global _listener
+    if _listener is not None:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for item in filter(None, (part.strip() for part in LOG_LEVELS.split(","))):
+        name, _, level = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(level.strip().upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    # Flushes whatever is still queued
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+async def request_id_middleware(request, call_next):
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
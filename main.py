@@ -1,11 +1,46 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import database
 from database import db
 from fastapi import HTTPException
+from fastapi.responses import Response
+from indexes import ensure_indexes
+import authors
+import hashing
+import jobs
+import metrics
+import migrations
+import reaction_buffer
+import realtime
+import response_cache
+from pagination import NEXT_CURSOR_HEADER
+from logging_config import REQUEST_ID_HEADER, request_id_middleware, setup_logging, shutdown_logging
 import os
 from dotenv import load_dotenv
 
-app = FastAPI()
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    setup_logging()
+    await database.connect()
+    await ensure_indexes(db)
+    await migrations.warn_pending()
+    realtime.start()
+    if reaction_buffer.REACTION_BUFFER_ENABLED:
+        reaction_buffer.buffer.start()
+    jobs.start()
+    yield
+    await jobs.stop()
+    await realtime.stop()
+    # Flushes buffered likes/saves while the client is still open
+    await reaction_buffer.buffer.stop()
+    hashing.shutdown_executor()
+    database.close()
+    shutdown_logging()
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
 
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN")
@@ -17,7 +52,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER, "ETag", "Content-Range", "Accept-Ranges"],
 )
+app.middleware("http")(metrics.metrics_middleware)
+app.middleware("http")(request_id_middleware)
 
 @app.get("/")
 def read_root():
@@ -40,3 +78,32 @@ from routers import comment
 app.include_router(comment.router)
 from routers import auth
 app.include_router(auth.router)
+from routers import search
+app.include_router(search.router)
+from routers import events
+app.include_router(events.router)
+from routers import attachments
+app.include_router(attachments.router)
+
+@app.get("/cache-stats")
+def cache_stats():
+    return {"users": auth.user_cache.stats(), "authors": authors.author_cache.stats(), "responses": response_cache.response_cache.stats(), "password_hashing": hashing.pool_stats()}
+
+user_cache_hits = metrics.Gauge("user_cache_hits", "get_current_user cache hits since start")
+user_cache_misses = metrics.Gauge("user_cache_misses", "get_current_user cache misses since start")
+user_cache_size = metrics.Gauge("user_cache_size", "Entries in the get_current_user cache")
+password_hash_in_flight = metrics.Gauge("password_hash_in_flight", "bcrypt calls running or queued")
+reaction_buffer_pending = metrics.Gauge("reaction_buffer_pending", "Like/save toggles waiting for the next flush")
+
+@metrics.register_collector
+def collect_cache_stats():
+    stats = auth.user_cache.stats()
+    user_cache_hits.set(stats["hits"])
+    user_cache_misses.set(stats["misses"])
+    user_cache_size.set(stats["size"])
+    password_hash_in_flight.set(hashing.pool_stats()["in_flight"])
+    reaction_buffer_pending.set(len(reaction_buffer.buffer.pending))
+
+@app.get("/metrics")
+def read_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,256 @@
+import threading
+import time
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_registry = []
+_collectors = []
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Updated from the event loop and from pymongo's monitoring threads
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def register_collector(func):
+    """func() is called at scrape time to refresh gauges that mirror external state."""
+    _collectors.append(func)
+    return func
+
+
+def render() -> str:
+    for collect in _collectors:
+        collect()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+http_requests_total = Counter("http_requests_total", "HTTP responses by route and status", ("method", "route", "status"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+mongo_command_duration = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command"))
+mongo_documents_total = Counter("mongo_documents_total", "Documents returned or written by MongoDB commands", ("collection", "command"))
+mongo_command_errors_total = Counter("mongo_command_errors_total", "Failed MongoDB commands", ("collection", "command"))
+
+
+async def metrics_middleware(request, call_next):
+    http_requests_in_flight.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_requests_in_flight.dec()
+        # Label by route template, not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        http_request_duration.observe(time.perf_counter() - start, method=request.method, route=path)
+        http_requests_total.inc(method=request.method, route=path, status=status)
+
+
+def _documents(command_name: str, reply) -> int:
+    if command_name in ("find", "aggregate"):
+        return len(reply.get("cursor", {}).get("firstBatch", []))
+    if command_name == "getMore":
+        return len(reply.get("cursor", {}).get("nextBatch", []))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if command_name in ("insert", "update", "delete", "count"):
+        return reply.get("n", 0)
+    return 0
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per-collection, per-command timings and document counts for every client command."""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _collection(self, event):
+        name = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+        # Admin/handshake commands carry 1 instead of a collection name
+        return name if isinstance(name, str) else None
+
+    def started(self, event):
+        collection = self._collection(event)
+        if collection:
+            with self._lock:
+                self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        if collection:
+            mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+            mongo_documents_total.inc(_documents(event.command_name, event.reply), collection=collection, command=event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        if collection:
+            mongo_command_duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+            mongo_command_errors_total.inc(collection=collection, command=event.command_name)
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+mongo_pool_wait = Histogram("mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the pool", ("address",))
+mongo_pool_checkout_failures_total = Counter("mongo_pool_checkout_failures_total", "Failed connection checkouts", ("address", "reason"))
+mongo_pool_connections = Gauge("mongo_pool_connections", "Open pooled connections", ("address",))
+mongo_pool_checked_out = Gauge("mongo_pool_checked_out", "Connections currently checked out", ("address",))
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Pool occupancy and checkout wait times, for sizing maxPoolSize per worker."""
+
+    def __init__(self):
+        self._checkout_started = {}
+        self._lock = threading.Lock()
+
+    def _address(self, event):
+        return "%s:%s" % event.address
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address=self._address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address=self._address(event))
+
+    def connection_check_out_started(self, event):
+        # Checkouts happen on the calling thread; older pymongo has no duration on the events
+        with self._lock:
+            self._checkout_started[threading.get_ident()] = time.perf_counter()
+
+    def _wait(self, event):
+        with self._lock:
+            started = self._checkout_started.pop(threading.get_ident(), None)
+        duration = getattr(event, "duration", None)
+        if duration is None and started is not None:
+            duration = time.perf_counter() - started
+        return duration
+
+    def connection_check_out_failed(self, event):
+        self._wait(event)
+        mongo_pool_checkout_failures_total.inc(address=self._address(event), reason=event.reason)
+
+    def connection_checked_out(self, event):
+        wait = self._wait(event)
+        if wait is not None:
+            mongo_pool_wait.observe(wait, address=self._address(event))
+        mongo_pool_checked_out.inc(address=self._address(event))
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec(address=self._address(event))
+
+
+mongo_pool_metrics = MongoPoolMetrics()
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import db
+from indexes import ensure_indexes
+from reactions import LIKE, SAVE, COUNTER_FIELDS
+
+BATCH_SIZE = 500
+
+# Embedded array -> reaction kind, per target collection
+SOURCES = {
+    "posts": {"likes": LIKE, "saves": SAVE},
+    "comments": {"likes": LIKE},
+}
+
+
+async def insert_reactions(docs):
+    if not docs:
+        return 0
+    try:
+        result = await db["reactions"].insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        # Duplicates mean the reaction was already migrated (or re-created by a toggle)
+        if any(err["code"] != 11000 for err in e.details["writeErrors"]):
+            raise
+        return e.details["nInserted"]
+
+
+async def migrate_collection(name: str, fields: dict):
+    query = {"$or": [{field: {"$exists": True}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    migrated = inserted = 0
+    now = datetime.now(timezone.utc)
+    while True:
+        batch = await db[name].find(query, projection).limit(BATCH_SIZE).to_list(length=BATCH_SIZE)
+        if not batch:
+            break
+        reactions = []
+        for doc in batch:
+            for field, kind in fields.items():
+                for user_id in set(doc.get(field) or []):
+                    reactions.append({"user_id": user_id, "target": doc["_id"], "kind": kind, "collection": name, "createdAt": now})
+        inserted += await insert_reactions(reactions)
+
+        # Counters are recomputed from the reactions collection so re-runs stay exact
+        ids = [doc["_id"] for doc in batch]
+        counts = {}
+        async for c in db["reactions"].aggregate([
+            {"$match": {"target": {"$in": ids}, "kind": {"$in": list(fields.values())}}},
+            {"$group": {"_id": {"target": "$target", "kind": "$kind"}, "count": {"$sum": 1}}},
+        ]):
+            counts[(c["_id"]["target"], c["_id"]["kind"])] = c["count"]
+        ops = []
+        for doc_id in ids:
+            counters = {COUNTER_FIELDS[kind]: counts.get((doc_id, kind), 0) for kind in fields.values()}
+            ops.append(UpdateOne({"_id": doc_id}, {"$set": counters, "$unset": {field: "" for field in fields}}))
+        await db[name].bulk_write(ops, ordered=False)
+        migrated += len(batch)
+        print(f"{name}: migrated {migrated} documents, {inserted} reactions inserted")
+    return migrated
+
+
+async def migrate():
+    await ensure_indexes(db)
+    for name, fields in SOURCES.items():
+        await migrate_collection(name, fields)
+    print("Reaction migration complete!")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,189 @@
+"""Versioned data migrations.
+
+    python migrations.py            # apply everything pending
+    python migrations.py --status   # list versions and progress
+    python migrations.py --to 2     # stop after version 2
+
+Each migration walks its collections in _id order, in batches, and records
+a checkpoint after every batch in the schema_migrations collection, so an
+interrupted run resumes where it stopped. Only values still in the old form
+are selected, and each write is conditional on the old value, so re-running
+(or running alongside the app) is safe. Documents written in the old form
+during a pass are picked up by another pass.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone
+from pymongo import ReturnDocument, UpdateOne
+from bson_types import stored_ref, to_datetime, to_object_id
+from database import db
+from indexes import ensure_indexes
+import migrate_reactions
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+MAX_PASSES = 5
+RUNNING, DONE = "running", "done"
+OBJECT_ID_STRING = {"$type": "string", "$regex": "^[0-9a-fA-F]{24}$"}
+
+MIGRATIONS = {}
+
+
+def migration(version: int, name: str):
+    def register(func):
+        MIGRATIONS[version] = (name, func)
+        return func
+    return register
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+
+class Run:
+    def __init__(self, doc: dict, batch_size: int):
+        self.version = doc["_id"]
+        self.checkpoints = doc.get("checkpoints", {})
+        self.batch_size = batch_size
+
+    async def record(self, step: str, last_id, **counts):
+        self.checkpoints[step] = last_id
+        update = {"$set": {f"checkpoints.{step}": last_id, "updatedAt": _now()}}
+        if counts:
+            update["$inc"] = {f"progress.{step}.{key}": value for key, value in counts.items()}
+        await db["schema_migrations"].update_one({"_id": self.version}, update)
+
+    async def convert(self, step: str, collection: str, query: dict, projection: dict, convert):
+        """Rewrite the docs matching query with convert(doc) -> {path: new value}.
+
+        Returns how many documents still match when no pass converts anything
+        more (values that cannot be converted, e.g. unparsable dates).
+        """
+        for _ in range(MAX_PASSES):
+            converted = 0
+            last_id = self.checkpoints.get(step)
+            while True:
+                batch_query = {"$and": [query, {"_id": {"$gt": last_id}}]} if last_id is not None else query
+                docs = await db[collection].find(batch_query, projection).sort("_id", 1).limit(self.batch_size).to_list(length=self.batch_size)
+                if not docs:
+                    break
+                ops = []
+                for doc in docs:
+                    updates = {path: value for path, value in convert(doc).items() if value != _get(doc, path)}
+                    if updates:
+                        ops.append(UpdateOne({"_id": doc["_id"], **{path: _get(doc, path) for path in updates}}, {"$set": updates}))
+                modified = (await db[collection].bulk_write(ops, ordered=False)).modified_count if ops else 0
+                converted += modified
+                last_id = docs[-1]["_id"]
+                await self.record(step, last_id, scanned=len(docs), converted=modified)
+                print(f"  {step}: converted {modified}/{len(docs)} up to {last_id}")
+            remaining = await db[collection].count_documents(query)
+            # The next pass (or a re-run) starts from the beginning again
+            await self.record(step, None)
+            if not remaining or not converted:
+                if remaining:
+                    logger.warning("%s: %d documents could not be converted", step, remaining)
+                return remaining
+        return remaining
+
+
+@migration(1, "Move embedded likes/saves arrays into the reactions collection")
+async def reactions_collection(run: Run):
+    # Predates this runner; already idempotent on its own
+    for name, fields in migrate_reactions.SOURCES.items():
+        await migrate_reactions.migrate_collection(name, fields)
+
+
+def _convert_replies(replies, field: str, convert):
+    if not isinstance(replies, list):
+        return replies
+    return [{**reply, field: convert(reply[field])} if isinstance(reply, dict) and field in reply else reply
+            for reply in replies]
+
+
+@migration(2, "Store createdAt and joined as BSON dates")
+async def dates(run: Run):
+    string = {"$type": "string"}
+    await run.convert("post_dates", "posts", {"createdAt": string}, {"createdAt": 1},
+                      lambda doc: {"createdAt": to_datetime(doc["createdAt"])})
+    await run.convert(
+        "comment_dates", "comments",
+        {"$or": [{"createdAt": string}, {"replies.createdAt": string}]},
+        {"createdAt": 1, "replies": 1},
+        lambda doc: {
+            "createdAt": to_datetime(doc.get("createdAt")),
+            "replies": _convert_replies(doc.get("replies"), "createdAt", to_datetime),
+        },
+    )
+    await run.convert("user_joined", "users", {"joined": string}, {"joined": 1},
+                      lambda doc: {"joined": to_datetime(doc["joined"])})
+
+
+@migration(3, "Store post_id and author._id references as ObjectIds")
+async def object_id_refs(run: Run):
+    await run.convert("post_authors", "posts", {"author._id": OBJECT_ID_STRING}, {"author": 1},
+                      lambda doc: {"author._id": to_object_id(doc["author"]["_id"])})
+    await run.convert(
+        "comment_refs", "comments",
+        {"$or": [{"post_id": OBJECT_ID_STRING}, {"author._id": OBJECT_ID_STRING}, {"replies.author._id": OBJECT_ID_STRING}]},
+        {"post_id": 1, "author": 1, "replies": 1},
+        lambda doc: {
+            "post_id": to_object_id(doc.get("post_id")),
+            "author._id": to_object_id(_get(doc, "author._id")),
+            "replies": _convert_replies(doc.get("replies"), "author", stored_ref),
+        },
+    )
+
+
+async def pending() -> list:
+    done = {doc["_id"] async for doc in db["schema_migrations"].find({"status": DONE}, {"_id": 1})}
+    return [version for version in sorted(MIGRATIONS) if version not in done]
+
+
+async def warn_pending():
+    # The app reads both forms, so it keeps serving; this is a reminder, not a failure
+    versions = await pending()
+    if versions:
+        logger.warning("Pending data migrations: %s (run python migrations.py)", ", ".join(map(str, versions)))
+
+
+async def migrate(target: int = None, batch_size: int = BATCH_SIZE):
+    await ensure_indexes(db)
+    for version in await pending():
+        if target is not None and version > target:
+            break
+        name, func = MIGRATIONS[version]
+        print(f"{version:>3}  {name}")
+        doc = await db["schema_migrations"].find_one_and_update(
+            {"_id": version},
+            {"$set": {"name": name, "status": RUNNING, "updatedAt": _now()}, "$setOnInsert": {"startedAt": _now()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        await func(Run(doc, batch_size))
+        await db["schema_migrations"].update_one({"_id": version}, {"$set": {"status": DONE, "finishedAt": _now()}})
+    print("Migrations are up to date" if target is None else f"Migrated to version {target}")
+
+
+async def show():
+    applied = {doc["_id"]: doc async for doc in db["schema_migrations"].find()}
+    for version, (name, _) in sorted(MIGRATIONS.items()):
+        doc = applied.get(version, {})
+        print(f"{version:>3}  {doc.get('status', 'pending'):<8} {name}  {doc.get('progress', '')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply versioned data migrations")
+    parser.add_argument("--status", action="store_true", help="Only list migrations and their progress")
+    parser.add_argument("--to", type=int, dest="target", help="Highest version to apply")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(show() if args.status else migrate(args.target, args.batch_size))
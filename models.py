@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Union
+from datetime import datetime
 
 class User(BaseModel):
     id: Optional[str]
@@ -17,7 +18,7 @@ class AuthUser(BaseModel):
     linkedin: Optional[str] = None
     github: Optional[str] = None
     college: Optional[str] = None
-    joined: Optional[str] = None
+    joined: Optional[Union[datetime, str]] = None
 
 class CreateUser(BaseModel):
     username: str
@@ -29,26 +30,31 @@ class CreateUser(BaseModel):
     linkedin: Optional[str] = None
     github: Optional[str] = None
     college: Optional[str] = None
-    joined: Optional[str] = None
+    joined: Optional[Union[datetime, str]] = None
 
 class UserLogin(BaseModel):
     username: str
     password: str
 
+# Dates and ids are stored as BSON dates/ObjectIds (see bson_types.py); the API
+# sends strings, and both forms are accepted while older documents are migrated
 class Reply(BaseModel):
     id: Optional[str] = None
     content: str
     author: dict  # { _id: str, name: str }
-    createdAt: str
+    createdAt: Union[datetime, str]
     likes: List[str] = []
 
 class Comment(BaseModel):
     id: Optional[str] = None
     content: str
     author: dict  # { _id: str, name: str }
-    createdAt: str
-    likes: List[str] = []
-    replies: List[Reply] = []
+    createdAt: Union[datetime, str]
+    likes: List[str] = []  # legacy embedded array, superseded by the reactions collection
+    likesCount: int = 0
+    likedByMe: bool = False
+    replies: List[Reply] = []  # only the first few on listings; see repliesCount
+    repliesCount: int = 0
     post_id: str
 
 class Post(BaseModel):
@@ -60,8 +66,17 @@ class Post(BaseModel):
     attachments: List[str] = []
     tags: List[dict] = []  # [{ _id: str, name: str }]
     author: dict
-    createdAt: str
-    likes: List[str] = []
+    createdAt: Union[datetime, str]
+    likes: List[str] = []  # legacy embedded arrays, superseded by the reactions collection
     saves: List[str] = []
+    likesCount: int = 0
+    savesCount: int = 0
+    likedByMe: bool = False
+    savedByMe: bool = False
     commentsCount: Optional[int] = 0
-    # comments: List[Comment] = []
\ No newline at end of file
+    # comments: List[Comment] = []
+class SearchResult(BaseModel):
+    type: str  # "post" | "comment"
+    score: float
+    post: Optional[Post] = None
+    comment: Optional[Comment] = None
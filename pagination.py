@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_value(value):
+    # BSON dates (e.g. reactions.createdAt) round-trip as {"$date": iso}
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+
+def encode_cursor(doc, sort_field: str = "createdAt") -> str:
+    payload = {"v": _encode_value(doc.get(sort_field)), "id": str(doc["_id"])}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return _decode_value(payload["v"]), ObjectId(payload["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(cursor: str, sort_field: str = "createdAt", direction: int = -1) -> dict:
+    # Everything strictly after the last item of the previous page in (sort_field, _id) order
+    value, last_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    clauses = [
+        {sort_field: {op: value}},
+        {sort_field: value, "_id": {op: last_id}},
+    ]
+    # Legacy string dates sort before BSON dates, and $lt/$gt never compare across
+    # types, so while both exist the other type has to be included explicitly
+    if isinstance(value, datetime) and direction < 0:
+        clauses.append({sort_field: {"$type": "string"}})
+    elif isinstance(value, str) and direction > 0:
+        clauses.append({sort_field: {"$type": "date"}})
+    return {"$or": clauses}
+
+
+async def fetch_page(collection, query: dict, limit: int, cursor: str = None, sort_field: str = "createdAt", projection: dict = None, direction: int = -1):
+    """Return (docs, next_cursor) for a keyset page over (sort_field, _id), newest first by default."""
+    if cursor:
+        after = keyset_filter(cursor, sort_field, direction)
+        query = {"$and": [query, after]} if query else after
+    docs_cursor = collection.find(query, projection).sort([(sort_field, direction), ("_id", direction)]).limit(limit + 1)
+    docs = await docs_cursor.to_list(length=limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from database import db
+from reactions import COUNTER_FIELDS, toggle_reaction
+import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Off by default: buffered toggles live only in this process until the next flush
+REACTION_BUFFER_ENABLED = os.getenv("REACTION_BUFFER_ENABLED", "false").lower() in ("1", "true", "yes")
+REACTION_FLUSH_MS = float(os.getenv("REACTION_FLUSH_MS", "50"))
+REACTION_FLUSH_OPS = int(os.getenv("REACTION_FLUSH_OPS", "500"))
+
+
+class ReactionBuffer:
+    """Write-behind buffer for like/save toggles on hot documents.
+
+    Toggles are recorded as the desired end state per (collection, target,
+    kind, user); flipping back to the stored state drops the entry. A flush
+    writes the new reactions in one bulk_write, the removed ones with one
+    delete per counter, and each touched counter with a single $inc, instead
+    of one counter update per click. Counts returned
+    to clients include everything still buffered.
+    """
+
+    def __init__(self, flush_ms: float = REACTION_FLUSH_MS, flush_ops: int = REACTION_FLUSH_OPS):
+        self.flush_interval = flush_ms / 1000
+        self.flush_ops = flush_ops
+        self.pending = {}   # (collection, target, kind, user_id) -> (desired, stored)
+        self.inflight = {}  # same keys -> desired, while a flush is writing them
+        self.counts = {}    # (collection, target, kind) -> count including buffered changes
+        self._flush_lock = asyncio.Lock()
+        self._wake = None
+        self._task = None
+
+    async def toggle(self, collection, target_id, kind: str, user_id: str):
+        """Same contract as reactions.toggle_reaction: (count, active) or None."""
+        count_key = (collection.name, target_id, kind)
+        key = count_key + (user_id,)
+        # Every await can race a flush or another toggle, so state is re-checked after each
+        while True:
+            if count_key not in self.counts:
+                counter = COUNTER_FIELDS[kind]
+                doc = await collection.find_one({"_id": target_id}, {counter: 1})
+                if doc is None:
+                    return None
+                self.counts.setdefault(count_key, doc.get(counter, 0))
+                continue
+            if key in self.pending:
+                current, stored = self.pending[key]
+                break
+            if key in self.inflight:
+                current = stored = self.inflight[key]
+                break
+            found = await db["reactions"].find_one({"user_id": user_id, "target": target_id, "kind": kind}, {"_id": 1})
+            if key not in self.pending and key not in self.inflight and count_key in self.counts:
+                current = stored = found is not None
+                break
+        desired = not current
+        if desired == stored:
+            self.pending.pop(key, None)
+        else:
+            self.pending[key] = (desired, stored)
+        self.counts[count_key] += 1 if desired else -1
+        if len(self.pending) >= self.flush_ops and self._wake is not None:
+            self._wake.set()
+        return self.counts[count_key], desired
+
+    def pending_kinds(self, user_id: str, target_ids) -> dict:
+        """str(target) -> {kind: desired} for user_id's buffered toggles."""
+        wanted = set(target_ids)
+        state = {}
+        for (_, target_id, kind, uid), (desired, _) in self.pending.items():
+            if uid == user_id and target_id in wanted:
+                state.setdefault(str(target_id), {})[kind] = desired
+        return state
+
+    def discard(self, target_id):
+        # The target was deleted: its buffered reactions must not be written back
+        for key in [k for k in self.pending if k[1] == target_id]:
+            del self.pending[key]
+        for key in [k for k in self.counts if k[1] == target_id]:
+            del self.counts[key]
+
+    async def _write_reactions(self, batch: dict):
+        """Apply the batch to reactions; returns (counter deltas, keys to requeue).
+
+        Deltas come from what the writes actually did: an upsert that found
+        the reaction already there or a delete that matched nothing adds 0.
+        """
+        deltas = {}
+        failed = []
+        now = datetime.now(timezone.utc)
+        adds = [key for key, (desired, _) in batch.items() if desired]
+        if adds:
+            ops = [UpdateOne({"user_id": user_id, "target": target_id, "kind": kind},
+                             {"$setOnInsert": {"collection": collection, "createdAt": now}}, upsert=True)
+                   for collection, target_id, kind, user_id in adds]
+            try:
+                inserted = set((await db["reactions"].bulk_write(ops, ordered=False)).upserted_ids)
+            except BulkWriteError as e:
+                # Unordered: every op not listed in writeErrors was applied
+                inserted = {upsert["index"] for upsert in e.details.get("upserted", [])}
+                errors = {error["index"] for error in e.details.get("writeErrors", [])}
+                failed += [adds[i] for i in errors]
+            except PyMongoError:
+                # Nothing is known to have applied; a retried upsert that finds its reaction adds 0
+                logger.exception("Reaction upserts failed")
+                inserted = set()
+                failed += adds
+            for i in inserted:
+                count_key = adds[i][:3]
+                deltas[count_key] = deltas.get(count_key, 0) + 1
+        # One delete per counter, so deleted_count is exactly that counter's change
+        removes = {}
+        for key, (desired, _) in batch.items():
+            if not desired:
+                removes.setdefault(key[:3], []).append(key)
+        for count_key, keys in removes.items():
+            _, target_id, kind = count_key
+            try:
+                result = await db["reactions"].delete_many({"target": target_id, "kind": kind, "user_id": {"$in": [key[3] for key in keys]}})
+            except PyMongoError:
+                logger.exception("Reaction deletes failed")
+                failed += keys
+                continue
+            if result.deleted_count:
+                deltas[count_key] = deltas.get(count_key, 0) - result.deleted_count
+        return deltas, failed
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, {}
+            self.inflight = {key: desired for key, (desired, _) in batch.items()}
+            try:
+                deltas, failed = await self._write_reactions(batch)
+                if failed:
+                    # Only writes that did not apply go back, so no counter change is applied twice
+                    logger.error("Reaction flush: %d of %d toggles requeued", len(failed), len(batch))
+                    for key in failed:
+                        self.pending.setdefault(key, batch[key])
+                counter_ops = {}
+                for (collection, target_id, kind), delta in deltas.items():
+                    counter_ops.setdefault(collection, []).append(UpdateOne({"_id": target_id}, {"$inc": {COUNTER_FIELDS[kind]: delta}}))
+                for collection, collection_ops in counter_ops.items():
+                    try:
+                        await db[collection].bulk_write(collection_ops, ordered=False)
+                    except PyMongoError:
+                        # The reactions are written; retrying an $inc that may have applied would double it
+                        logger.exception("Reaction counter update failed for %s", collection)
+                if deltas:
+                    try:
+                        await response_cache.bump(response_cache.POSTS)
+                    except Exception:
+                        # The writes stand; cached pages catch up on the next bump
+                        logger.exception("Cache bump after reaction flush failed")
+            except Exception:
+                # Unexpected failure: retried writes only count what they change, so nothing is counted twice
+                for key, entry in batch.items():
+                    self.pending.setdefault(key, entry)
+                raise
+            finally:
+                self.inflight = {}
+                # Re-read counts that have settled, picking up other workers' writes
+                busy = {key[:3] for key in self.pending}
+                for count_key in {key[:3] for key in batch} - busy:
+                    self.counts.pop(count_key, None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # One bad flush must not end the task, or toggles would pile up until shutdown
+                logger.exception("Reaction flush failed")
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Never cancel a flush halfway through its writes
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Whatever is still buffered is written before the client closes
+        await self.flush()
+
+
+buffer = ReactionBuffer()
+
+
+async def toggle(collection, target_id, kind: str, user_id: str):
+    if REACTION_BUFFER_ENABLED:
+        return await buffer.toggle(collection, target_id, kind, user_id)
+    return await toggle_reaction(collection, target_id, kind, user_id)
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from database import db
+from pagination import fetch_page
+
+LIKE = "like"
+SAVE = "save"
+
+# Counter field on the target document for each reaction kind
+COUNTER_FIELDS = {
+    LIKE: "likesCount",
+    SAVE: "savesCount",
+}
+
+
+async def toggle_reaction(collection, target_id: ObjectId, kind: str, user_id: str):
+    """Flip user_id's reaction of the given kind on a post or comment.
+
+    Returns (count, active) or None when the target does not exist.
+    """
+    counter = COUNTER_FIELDS[kind]
+    key = {"user_id": user_id, "target": target_id, "kind": kind}
+    try:
+        await db["reactions"].insert_one({**key, "collection": collection.name, "createdAt": datetime.now(timezone.utc)})
+        delta = 1
+    except DuplicateKeyError:
+        result = await db["reactions"].delete_one(key)
+        # A concurrent toggle may already have removed it; then there is nothing to count
+        delta = -result.deleted_count
+    doc = await collection.find_one_and_update(
+        {"_id": target_id},
+        {"$inc": {counter: delta}},
+        projection={counter: 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        if delta > 0:
+            await db["reactions"].delete_one(key)
+        return None
+    return doc.get(counter, 0), delta > 0
+
+
+async def reactions_by_user(user_id: str, target_ids) -> dict:
+    """Map str(target id) -> set of kinds user_id has on those targets, in one query."""
+    reacted = {}
+    if not user_id or not target_ids:
+        return reacted
+    cursor = db["reactions"].find(
+        {"user_id": user_id, "target": {"$in": list(target_ids)}},
+        {"_id": 0, "target": 1, "kind": 1},
+    )
+    async for r in cursor:
+        reacted.setdefault(str(r["target"]), set()).add(r["kind"])
+    return reacted
+
+
+async def reacted_page(user_id: str, kind: str, collection_name: str, limit: int, cursor: str = None):
+    """Return (target ids, next_cursor) for user_id's reactions of kind, most recent first."""
+    # Reactions written before "collection" was recorded have no such field
+    query = {"user_id": user_id, "kind": kind, "collection": {"$in": [collection_name, None]}}
+    docs, next_cursor = await fetch_page(db["reactions"], query, limit, cursor, projection={"target": 1, "createdAt": 1})
+    return [doc["target"] for doc in docs], next_cursor
+
+
+async def delete_reactions(target_ids):
+    await db["reactions"].delete_many({"target": {"$in": list(target_ids)}})
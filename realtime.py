@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import os
+import signal
+from pymongo.errors import OperationFailure, PyMongoError
+from bson_types import public_ref, to_iso
+from database import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection; a client that falls this far behind is dropped
+REALTIME_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "256"))
+REALTIME_MAX_SUBSCRIBERS = int(os.getenv("REALTIME_MAX_SUBSCRIBERS", "5000"))
+REALTIME_RETRY_SECONDS = float(os.getenv("REALTIME_RETRY_SECONDS", "2"))
+
+# Change streams need a replica set or sharded cluster
+_NOT_REPLICA_SET = 40573
+# The resume token fell off the oplog
+_HISTORY_LOST = (280, 286)
+
+POST_FIELDS = ("title", "content", "category", "link", "attachments", "tags", "author", "createdAt",
+               "likesCount", "savesCount", "commentsCount")
+COMMENT_FIELDS = ("content", "author", "createdAt", "post_id", "likesCount")
+
+realtime_subscribers = metrics.Gauge("realtime_subscribers", "Open realtime event streams")
+realtime_events_total = metrics.Counter("realtime_events_total", "Realtime events published", ("event",))
+realtime_dropped_total = metrics.Counter("realtime_dropped_subscribers_total", "Realtime streams dropped for falling behind")
+
+CLOSED = object()
+
+
+def _public(doc: dict, fields) -> dict:
+    data = {field: doc[field] for field in fields if field in doc}
+    # Same forms as the REST responses
+    if "createdAt" in data:
+        data["createdAt"] = to_iso(data["createdAt"])
+    if "author" in data:
+        data["author"] = public_ref(data["author"])
+    return data
+
+
+def event_from_change(change: dict):
+    """Map a change event on posts/comments to the event sent to clients, or None.
+
+    Comment edits, likes and deletes carry no post_id without a lookup and are
+    not pushed; the post's commentsCount update is.
+    """
+    collection = change["ns"]["coll"]
+    operation = change["operationType"]
+    doc_id = str(change["documentKey"]["_id"])
+    if collection == "posts":
+        if operation == "insert":
+            post = change["fullDocument"]
+            return {"event": "post.created", "post_id": doc_id, "category": post.get("category"),
+                    "data": {"id": doc_id, **_public(post, POST_FIELDS)}}
+        if operation in ("update", "replace"):
+            fields = change.get("fullDocument") or change.get("updateDescription", {}).get("updatedFields", {})
+            data = _public(fields, POST_FIELDS)
+            if not data:
+                return None
+            return {"event": "post.updated", "post_id": doc_id, "data": data}
+        if operation == "delete":
+            return {"event": "post.deleted", "post_id": doc_id}
+    elif collection == "comments" and operation == "insert":
+        comment = change["fullDocument"]
+        return {"event": "comment.created", "post_id": str(comment.get("post_id")),
+                "data": {"id": doc_id, **_public(comment, COMMENT_FIELDS)}}
+    return None
+
+
+class Subscriber:
+    def __init__(self, post_ids=(), categories=()):
+        self.post_ids = set(post_ids)
+        self.categories = set(categories)
+        self.queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+        self.dropped = False
+
+    def matches(self, event: dict) -> bool:
+        if event["post_id"] in self.post_ids:
+            return True
+        # New posts go to feed listeners: everyone without a post filter, or the chosen categories
+        if event["event"] == "post.created":
+            return event["category"] in self.categories if self.categories else not self.post_ids
+        return False
+
+
+class Broker:
+    """In-process fan-out: publishing never waits on a subscriber."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.closing = False
+
+    def subscribe(self, post_ids=(), categories=()):
+        if self.closing or len(self.subscribers) >= REALTIME_MAX_SUBSCRIBERS:
+            return None
+        subscriber = Subscriber(post_ids, categories)
+        self.subscribers.add(subscriber)
+        realtime_subscribers.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            realtime_subscribers.dec()
+
+    def _end(self, subscriber: Subscriber, final=None):
+        # Make room for a final message and the end marker, discarding the backlog
+        while subscriber.queue.qsize() > REALTIME_QUEUE_SIZE - 2:
+            subscriber.queue.get_nowait()
+        if final is not None:
+            subscriber.queue.put_nowait(final)
+        subscriber.queue.put_nowait(CLOSED)
+        self.unsubscribe(subscriber)
+
+    def publish(self, event: dict):
+        realtime_events_total.inc(event=event["event"])
+        for subscriber in list(self.subscribers):
+            if not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                realtime_dropped_total.inc()
+                self._end(subscriber, {"event": "dropped", "reason": "slow consumer; reconnect and refetch"})
+
+    def close_all(self):
+        self.closing = True
+        for subscriber in list(self.subscribers):
+            self._end(subscriber)
+
+
+broker = Broker()
+_consumer = None
+_streaming = False
+
+
+def notify(collection: str, operation: str, doc_id, document: dict = None, updated: dict = None):
+    """Publish a write in-process when no change stream is feeding the broker.
+
+    Handlers call this after every write that clients should see; with a
+    change stream running it is a no-op, since the stream delivers the same
+    event to every worker.
+    """
+    if _streaming:
+        return
+    change = {"ns": {"coll": collection}, "operationType": operation, "documentKey": {"_id": doc_id}}
+    if document is not None:
+        change["fullDocument"] = document
+    if updated is not None:
+        change["updateDescription"] = {"updatedFields": updated}
+    event = event_from_change(change)
+    if event:
+        broker.publish(event)
+
+
+async def _consume():
+    global _streaming
+    pipeline = [{"$match": {
+        "ns.coll": {"$in": ["posts", "comments"]},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+    }}]
+    resume_token = None
+    while True:
+        try:
+            async with db.watch(pipeline, resume_after=resume_token) as stream:
+                _streaming = True
+                logger.info("Realtime change stream open")
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    event = event_from_change(change)
+                    if event:
+                        broker.publish(event)
+        except OperationFailure as e:
+            if e.code == _NOT_REPLICA_SET:
+                _streaming = False
+                logger.info("Change streams unavailable (standalone mongod); realtime events are published in-process only")
+                return
+            if e.code in _HISTORY_LOST:
+                resume_token = None
+            logger.warning("Realtime change stream failed: %s", e)
+        except PyMongoError as e:
+            logger.warning("Realtime change stream interrupted: %s", e)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            _streaming = False
+            logger.exception("Realtime change stream stopped; falling back to in-process events")
+            return
+        # Writes made while reconnecting are picked up from the resume token, so
+        # handlers keep leaving publishing to the stream
+        await asyncio.sleep(REALTIME_RETRY_SECONDS)
+
+
+def start():
+    global _consumer
+    if _consumer is None:
+        _consumer = asyncio.create_task(_consume())
+    close_on_signal()
+
+
+def close_on_signal():
+    # uvicorn waits for open responses before the lifespan shutdown runs stop(),
+    # so streams have to end as soon as SIGINT/SIGTERM arrives, or shutdown hangs
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(broker.close_all)
+            if callable(previous):
+                previous(signum, frame)
+
+        try:
+            signal.signal(sig, handler)
+        except ValueError:
+            # Not the main thread (e.g. the test client); stop() still closes streams
+            return
+
+
+async def stop():
+    global _consumer, _streaming
+    if _consumer is not None:
+        _consumer.cancel()
+        try:
+            await _consumer
+        except asyncio.CancelledError:
+            pass
+        _consumer = None
+    _streaming = False
+    broker.close_all()
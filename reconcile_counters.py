@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+from pymongo import UpdateOne
+from database import db
+from reactions import LIKE, SAVE, COUNTER_FIELDS
+
+BATCH_SIZE = 1000
+
+
+async def grouped_counts(collection: str, pipeline: list):
+    counts = {}
+    async for c in db[collection].aggregate(pipeline + [
+        {"$group": {"_id": "$_key", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        counts[c["_id"]] = c["count"]
+    return counts
+
+
+async def comment_counts():
+    counts = await grouped_counts("comments", [{"$project": {"_key": "$post_id"}}])
+    # Until migrations.py has run, a post's comments may be grouped under both id forms
+    merged = {}
+    for k, v in counts.items():
+        merged[str(k)] = merged.get(str(k), 0) + v
+    return merged
+
+
+async def reaction_counts(kind: str):
+    counts = await grouped_counts("reactions", [
+        {"$match": {"kind": kind}},
+        {"$project": {"_key": "$target"}},
+    ])
+    return {str(k): v for k, v in counts.items()}
+
+
+async def reconcile_collection(name: str, expected: dict, dry_run: bool):
+    """expected maps counter field -> {str(doc id): actual count}."""
+    ops = []
+    checked = drifted = 0
+    async for doc in db[name].find({}, {field: 1 for field in expected}):
+        checked += 1
+        fixes = {}
+        for field, counts in expected.items():
+            actual = counts.get(str(doc["_id"]), 0)
+            if doc.get(field) != actual:
+                fixes[field] = actual
+        if fixes:
+            drifted += 1
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fixes}))
+        if len(ops) >= BATCH_SIZE:
+            if not dry_run:
+                await db[name].bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not dry_run:
+        await db[name].bulk_write(ops, ordered=False)
+    action = "would fix" if dry_run else "fixed"
+    print(f"Checked {checked} {name}, {action} {drifted} with drifted counters")
+
+
+async def reconcile(dry_run: bool = False):
+    likes = await reaction_counts(LIKE)
+    await reconcile_collection("posts", {
+        "commentsCount": await comment_counts(),
+        COUNTER_FIELDS[LIKE]: likes,
+        COUNTER_FIELDS[SAVE]: await reaction_counts(SAVE),
+    }, dry_run)
+    await reconcile_collection("comments", {COUNTER_FIELDS[LIKE]: likes}, dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute denormalized counters on posts and comments")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift without writing")
+    args = parser.parse_args()
+    asyncio.run(reconcile(args.dry_run))
@@ -0,0 +1,70 @@
+import hashlib
+import os
+from fastapi.responses import Response
+from cache import TTLCache
+from database import db
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "10"))
+# max-age for anonymous responses; signed-in responses carry viewer flags and always revalidate
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "5"))
+
+POSTS = "posts"
+
+# Keys include the scope version, so a bump makes every older entry unreachable
+response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+
+async def get_version(scope: str) -> int:
+    # Kept in Mongo rather than in-process so every worker sees writes made by the others
+    doc = await db["cache_versions"].find_one({"_id": scope})
+    return doc["v"] if doc else 0
+
+
+async def bump(scope: str):
+    """Call after any write that changes what the cached routes of scope return."""
+    await db["cache_versions"].update_one({"_id": scope}, {"$inc": {"v": 1}}, upsert=True)
+    response_cache.invalidate_where(lambda key: key[0] == scope)
+
+
+def make_etag(key, viewer_id) -> str:
+    digest = hashlib.sha1(repr((key, viewer_id)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def cache_headers(etag: str, viewer_id) -> dict:
+    if viewer_id:
+        cache_control = "private, no-cache"
+    else:
+        cache_control = f"public, max-age={HTTP_CACHE_MAX_AGE}"
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/ prefixes are ignored on both sides
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+async def serve(request, response, scope: str, build, viewer_id=None):
+    """Return build()'s value through the response cache, or a 304 Response.
+
+    The cached value must not depend on the viewer; per-viewer fields are
+    added by the caller to a copy. build() must read from the primary, or a
+    stale secondary read would be cached until the next bump.
+    """
+    version = await get_version(scope)
+    key = (scope, version, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    etag = make_etag(key, viewer_id)
+    headers = cache_headers(etag, viewer_id)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    value = response_cache.get(key)
+    if value is None:
+        value = await build()
+        response_cache.set(key, value)
+    response.headers.update(headers)
+    return value
@@ -0,0 +1,251 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+from python_multipart.multipart import MultipartParser, parse_options_header
+from bson import ObjectId
+from typing import Optional
+from urllib.parse import quote
+import hashlib
+import logging
+import os
+import database
+from database import db
+from models import AuthUser
+from routers.auth import get_current_user
+from response_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "attachments"
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(512 * 1024 * 1024)))
+# Upload data is handed to GridFS in pieces of about this size, download data read in them
+ATTACHMENT_IO_BYTES = int(os.getenv("ATTACHMENT_IO_BYTES", str(1024 * 1024)))
+# Room for boundaries and part headers when checking Content-Length up front
+MULTIPART_OVERHEAD = 16 * 1024
+# Anything else is sent as a download so uploaded HTML/SVG never runs on our origin
+INLINE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "application/pdf", "text/plain")
+
+router = APIRouter(
+    prefix="/attachments",
+    tags=["attachments"]
+)
+
+def get_bucket() -> AsyncIOMotorGridFSBucket:
+    return AsyncIOMotorGridFSBucket(database.get_client()[database.DB_NAME], bucket_name=BUCKET)
+
+class PartReader:
+    """Feeds body chunks to python-multipart and returns what each chunk completed.
+
+    Events are ("headers", {name: value}), ("data", bytes) and ("end", None),
+    in order, so part data can be written out as it arrives.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.events = []
+        self.headers = {}
+        self._field = b""
+        self._value = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        })
+
+    def feed(self, chunk: bytes) -> list:
+        self.parser.write(chunk)
+        events, self.events = self.events, []
+        return events
+
+    def _part_begin(self):
+        self.headers = {}
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self.headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _headers_finished(self):
+        self.events.append(("headers", self.headers))
+
+    def _part_data(self, data, start, end):
+        self.events.append(("data", bytes(data[start:end])))
+
+    def _part_end(self):
+        self.events.append(("end", None))
+
+def upload_filename(headers: dict) -> Optional[str]:
+    _, params = parse_options_header(headers.get(b"content-disposition"))
+    if params.get(b"name") != b"file" or not params.get(b"filename"):
+        return None
+    # Browsers send the bare name, but older clients include the local path
+    return os.path.basename(params[b"filename"].decode("utf-8", "replace").replace("\\", "/")) or "upload"
+
+async def store_upload(request: Request, reader: PartReader, owner: str):
+    """Stream the "file" part into GridFS; returns (grid_in, metadata incl. sha256)."""
+    grid_in = None
+    metadata = {"owner": owner}
+    receiving = finished = False
+    buffered = bytearray()
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async for chunk in request.stream():
+            for kind, value in reader.feed(chunk):
+                if kind == "headers" and grid_in is None:
+                    filename = upload_filename(value)
+                    if filename:
+                        metadata["contentType"] = value.get(b"content-type", b"application/octet-stream").decode("latin-1")
+                        grid_in = get_bucket().open_upload_stream(filename, metadata=metadata)
+                        receiving = True
+                elif kind == "data" and receiving:
+                    size += len(value)
+                    if size > ATTACHMENT_MAX_BYTES:
+                        raise HTTPException(status_code=413, detail=f"Attachments are limited to {ATTACHMENT_MAX_BYTES} bytes")
+                    digest.update(value)
+                    buffered += value
+                elif kind == "end" and receiving:
+                    receiving, finished = False, True
+            # Memory per upload stays around ATTACHMENT_IO_BYTES whatever the file size
+            if len(buffered) >= ATTACHMENT_IO_BYTES:
+                await grid_in.write(bytes(buffered))
+                buffered.clear()
+        if grid_in is None:
+            raise HTTPException(status_code=400, detail="No file part named 'file' in the upload")
+        if not finished:
+            raise HTTPException(status_code=400, detail="Upload ended before the file part was complete")
+        if buffered:
+            await grid_in.write(bytes(buffered))
+        # The files document is only written on close, so the digest still lands in it
+        metadata["sha256"] = digest.hexdigest()
+        await grid_in.set("metadata", metadata)
+        await grid_in.close()
+    except BaseException:
+        # Also on client disconnect: no half-written chunks are left behind
+        if grid_in is not None and not grid_in.closed:
+            await grid_in.abort()
+        raise
+    return grid_in, metadata
+
+@router.post("", status_code=201)
+async def upload_attachment(request: Request, current_user: AuthUser = Depends(get_current_user)):
+    """Upload one file as the multipart/form-data field "file". Identical content is stored once."""
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=415, detail="Expected a multipart/form-data body")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > ATTACHMENT_MAX_BYTES + MULTIPART_OVERHEAD:
+        raise HTTPException(status_code=413, detail=f"Attachments are limited to {ATTACHMENT_MAX_BYTES} bytes")
+
+    grid_in, metadata = await store_upload(request, PartReader(params[b"boundary"]), current_user.id)
+    sha256 = metadata["sha256"]
+    # Served by the sha256 index; the oldest copy wins so concurrent duplicates converge
+    original = await db[f"{BUCKET}.files"].find_one(
+        {"metadata.sha256": sha256, "length": grid_in.length},
+        sort=[("uploadDate", 1), ("_id", 1)],
+    )
+    deduplicated = original is not None and original["_id"] != grid_in._id
+    if deduplicated:
+        await get_bucket().delete(grid_in._id)
+        file_id, filename, metadata = original["_id"], original["filename"], original.get("metadata") or {}
+    else:
+        file_id, filename = grid_in._id, grid_in.filename
+    logger.info("Attachment stored", extra={"file_id": str(file_id), "length": grid_in.length, "deduplicated": deduplicated})
+    return {
+        "id": str(file_id),
+        "url": f"{router.prefix}/{file_id}",
+        "filename": filename,
+        "length": grid_in.length,
+        "contentType": metadata.get("contentType"),
+        "sha256": sha256,
+        "deduplicated": deduplicated,
+    }
+
+def parse_range(header: str, length: int) -> Optional[tuple]:
+    """Inclusive (start, end) of a single bytes range; None means send the whole file."""
+    unit, _, spec = header.partition("=")
+    # Multiple ranges are allowed to be answered with the full representation
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            # last < first makes the header invalid, so it is ignored rather than refused
+            if last and int(last) < start:
+                return None
+            end = min(int(last), length - 1) if last else length - 1
+        else:
+            suffix = int(last)
+            start, end = max(length - suffix, 0), length - 1
+            if suffix == 0:
+                start = length
+    except ValueError:
+        return None
+    if start < 0 or start > end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{length}"})
+    return start, end
+
+async def file_chunks(grid_out, start: int, length: int):
+    try:
+        grid_out.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = await grid_out.read(min(remaining, ATTACHMENT_IO_BYTES))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    finally:
+        # Also when the client disconnects mid-download
+        grid_out.close()
+
+@router.get("/{file_id}")
+async def download_attachment(file_id: str, request: Request):
+    if not ObjectId.is_valid(file_id):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    try:
+        grid_out = await get_bucket().open_download_stream(ObjectId(file_id))
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    metadata = grid_out.metadata or {}
+    content_type = metadata.get("contentType") or "application/octet-stream"
+    # Content never changes under an id, so the digest is a strong validator
+    etag = f'"{metadata.get("sha256") or file_id}"'
+    disposition = "inline" if content_type in INLINE_TYPES else "attachment"
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(grid_out.filename or file_id)}",
+        "X-Content-Type-Options": "nosniff",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        grid_out.close()
+        return Response(status_code=304, headers=headers)
+
+    length = grid_out.length
+    start, end, status_code = 0, length - 1, 200
+    range_header = request.headers.get("range")
+    # A stale If-Range means the client's partial copy is of something else
+    if range_header and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(range_header, length)
+        except HTTPException:
+            grid_out.close()
+            raise
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(file_chunks(grid_out, start, end - start + 1), status_code=status_code, media_type=content_type, headers=headers)
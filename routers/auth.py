@@ -1,35 +1,70 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Body
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from models import User, AuthUser, CreateUser
 from database import db
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Optional
+from cache import TTLCache
+from user_search import search_terms
+import authors
+from bson_types import to_datetime, to_iso
+import hashing
+import jobs
+import response_cache
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+# Conditional profile writes before giving up on a concurrently edited user
+UPDATE_ATTEMPTS = 3
 
 router = APIRouter(
     prefix="/auth",
     tags=["auth"]
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login", auto_error=False)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Process-local cache of authenticated users keyed by (user id, token iat). Each worker
+# has its own copy, so writes in another worker are only picked up once the TTL expires.
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def invalidate_user_cache(user_id: str):
+    user_cache.invalidate_where(lambda key: key[0] == user_id)
+    authors.invalidate(user_id)
+
+def duplicate_user_error(error: DuplicateKeyError) -> HTTPException:
+    # Raised by the username_unique / email_unique indexes; keyPattern names the field
+    fields = (error.details or {}).get("keyPattern") or {}
+    if "email" in fields or "email_unique" in str(error):
+        return HTTPException(status_code=400, detail="Email already registered")
+    return HTTPException(status_code=400, detail="Username already registered")
+
+async def ownership_error(collection, doc_id: ObjectId, what: str, action: str) -> HTTPException:
+    """Explain why an ownership-filtered write matched nothing: 404 or 403."""
+    if await collection.find_one({"_id": doc_id}, {"_id": 1}):
+        return HTTPException(status_code=403, detail=f"Not allowed to {action} this {what}")
+    return HTTPException(status_code=404, detail=f"{what.capitalize()} not found")
+
+# bcrypt runs in a bounded worker pool so it never blocks the event loop
+async def verify_password(plain_password, hashed_password):
+    return await hashing.verify_password(plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await hashing.hash_password(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
@@ -45,10 +80,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except JWTError:
         raise credentials_exception
+    cache_key = (user_id, payload.get("iat"))
+    cached_user = user_cache.get(cache_key)
+    if cached_user is not None:
+        return cached_user
     user = await db["users"].find_one({"_id": ObjectId(user_id)})
     if user is None:
         raise credentials_exception
-    return AuthUser(
+    auth_user = AuthUser(
         id=str(user["_id"]),
         username=user["username"],
         email=user["email"],
@@ -58,23 +97,32 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         linkedin=user.get("linkedin"),
         github=user.get("github"),
         college=user.get("college"),
-        joined=user.get("joined")
+        joined=to_iso(user.get("joined"))
     )
+    user_cache.set(cache_key, auth_user)
+    return auth_user
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme)):
+    # For public endpoints that personalise their output when a valid token is sent
+    if not token:
+        return None
+    try:
+        return await get_current_user(token)
+    except HTTPException:
+        return None
 
 @router.post("/register", response_model=AuthUser)
 async def register(user: CreateUser):
-    if await db["users"].find_one({"username": user.username}):
-        raise HTTPException(status_code=400, detail="Username already registered")
-    if await db["users"].find_one({"email": user.email}):
-        raise HTTPException(status_code=400, detail="Email already registered")
-    from datetime import datetime, timedelta, timezone
     user_dict = user.dict()
-    user_dict["password"] = get_password_hash(user.password)
-    # Set joined date to IST if not provided
-    if not user_dict.get("joined"):
-        ist = timezone(timedelta(hours=5, minutes=30))
-        user_dict["joined"] = datetime.now(ist).isoformat()
-    result = await db["users"].insert_one(user_dict)
+    user_dict["password"] = await get_password_hash(user.password)
+    user_dict["search_terms"] = search_terms(user.username, user.full_name)
+    # Stored as a BSON date; now if not provided
+    user_dict["joined"] = to_datetime(user_dict.get("joined") or datetime.now(timezone.utc))
+    # Uniqueness is enforced by the username/email indexes, not a read beforehand
+    try:
+        result = await db["users"].insert_one(user_dict)
+    except DuplicateKeyError as e:
+        raise duplicate_user_error(e)
     user_dict["id"] = str(result.inserted_id)
     return AuthUser(
         id=user_dict["id"],
@@ -86,13 +134,13 @@ async def register(user: CreateUser):
         linkedin=user_dict.get("linkedin"),
         github=user_dict.get("github"),
         college=user_dict.get("college"),
-        joined=user_dict.get("joined")
+        joined=to_iso(user_dict.get("joined"))
     )
 
 @router.post("/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     user = await db["users"].find_one({"username": form_data.username})
-    if not user or not verify_password(form_data.password, user["password"]):
+    if not user or not await verify_password(form_data.password, user["password"]):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token = create_access_token(data={"sub": str(user["_id"])})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -117,9 +165,6 @@ async def update_profile(
     if full_name is not None:
         update_data["full_name"] = full_name
     if email is not None:
-        # Check for unique email
-        if await db["users"].find_one({"email": email, "_id": {"$ne": ObjectId(current_user.id)}}):
-            raise HTTPException(status_code=400, detail="Email already registered")
         update_data["email"] = email
     if bio is not None:
         update_data["bio"] = bio
@@ -132,11 +177,36 @@ async def update_profile(
     if college is not None:
         update_data["college"] = college
     if joined is not None:
-        update_data["joined"] = joined
+        update_data["joined"] = to_datetime(joined)
     if not update_data:
         raise HTTPException(status_code=400, detail="No data to update")
-    await db["users"].update_one({"_id": ObjectId(current_user.id)}, {"$set": update_data})
-    user = await db["users"].find_one({"_id": ObjectId(current_user.id)})
+    # current_user comes from the user cache, so its username may predate a rename in another
+    # worker; search_terms are only written together with the username they were built from
+    username = current_user.username
+    for _ in range(UPDATE_ATTEMPTS):
+        query = {"_id": ObjectId(current_user.id)}
+        if full_name is not None:
+            query["username"] = username
+            update_data["search_terms"] = search_terms(username, full_name)
+        try:
+            user = await db["users"].find_one_and_update(query, {"$set": update_data}, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError as e:
+            raise duplicate_user_error(e)
+        if user is not None or full_name is None:
+            break
+        stored = await db["users"].find_one({"_id": ObjectId(current_user.id)}, {"username": 1})
+        if stored is None:
+            break
+        username = stored["username"]
+    else:
+        raise HTTPException(status_code=409, detail="User was modified concurrently, try again")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_cache(current_user.id)
+    if full_name is not None:
+        # Cached post responses carry author names
+        await response_cache.bump(response_cache.POSTS)
+        await jobs.enqueue("propagate_author_name", user_id=current_user.id)
     return AuthUser(
         id=str(user["_id"]),
         username=user["username"],
@@ -147,14 +217,15 @@ async def update_profile(
         linkedin=user.get("linkedin"),
         github=user.get("github"),
         college=user.get("college"),
-        joined=user.get("joined")
+        joined=to_iso(user.get("joined"))
     )
 
 @router.post("/change-password")
 async def change_password(old_password: str = Body(...), new_password: str = Body(...), current_user: AuthUser = Depends(get_current_user)):
     user = await db["users"].find_one({"_id": ObjectId(current_user.id)})
-    if not user or not verify_password(old_password, user["password"]):
+    if not user or not await verify_password(old_password, user["password"]):
         raise HTTPException(status_code=400, detail="Old password is incorrect")
-    hashed = get_password_hash(new_password)
+    hashed = await get_password_hash(new_password)
     await db["users"].update_one({"_id": ObjectId(current_user.id)}, {"$set": {"password": hashed}})
+    invalidate_user_cache(current_user.id)
     return {"message": "Password changed successfully"} 
\ No newline at end of file
@@ -1,90 +1,222 @@
-from fastapi import APIRouter, HTTPException, Path, Body, Depends
-from typing import List
-from models import Comment
-from database import db
+from fastapi import APIRouter, HTTPException, Path, Body, Depends, Query, Response
+from typing import List, Optional
+from models import Comment, Reply
+from database import db, read_db
 from bson import ObjectId
-from routers.auth import get_current_user
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+import logging
+from routers.auth import get_current_user, get_optional_user, ownership_error
+import authors
+from bson_types import id_match, public_ref, stored_ref, to_datetime, to_iso, to_object_id
+import realtime
+import response_cache
+from serialization import fast_response
+from reactions import LIKE, toggle_reaction, reactions_by_user, delete_reactions
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, fetch_page
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/comments",
     tags=["comments"]
 )
 
+DEFAULT_INLINE_REPLIES = 3
+MAX_INLINE_REPLIES = 20
+
+def comment_projection(replies: int) -> dict:
+    # Listings ship the first few replies and a count; the rest are paged via /{comment_id}/replies
+    return {
+        "content": 1,
+        "author": 1,
+        "createdAt": 1,
+        "likesCount": 1,
+        "post_id": 1,
+        "replies": {"$slice": replies},
+        "repliesCount": {"$size": {"$ifNull": ["$replies", []]}},
+    }
+
+def reply_helper(reply) -> dict:
+    return {
+        "id": reply.get("id"),
+        "content": reply.get("content"),
+        "author": public_ref(reply.get("author")),
+        "createdAt": to_iso(reply.get("createdAt")),
+        "likes": reply.get("likes", []),
+    }
+
 def comment_helper(comment) -> dict:
     return {
         "id": str(comment.get("_id")),
         "content": comment.get("content"),
-        "author": comment.get("author"),
-        "createdAt": comment.get("createdAt"),
-        "likes": comment.get("likes", []),
-        "replies": comment.get("replies", []),
+        "author": public_ref(comment.get("author")),
+        "createdAt": to_iso(comment.get("createdAt")),
+        "likes": [],
+        "likesCount": comment.get("likesCount", 0),
+        "replies": [reply_helper(reply) for reply in comment.get("replies", [])],
+        "repliesCount": comment.get("repliesCount", len(comment.get("replies", []))),
         "post_id": str(comment.get("post_id")) if comment.get("post_id") else None,
     }
 
-@router.get("/post/{post_id}", response_model=List[Comment])
-async def list_comments(post_id: str):
-    print(f"Fetching comments for post_id: {post_id}")
-    comments_cursor = db["comments"].find({"post_id": post_id})
+def stored_comment(comment_dict: dict) -> dict:
+    if "createdAt" in comment_dict:
+        comment_dict["createdAt"] = to_datetime(comment_dict["createdAt"])
+    if "author" in comment_dict:
+        comment_dict["author"] = stored_ref(comment_dict["author"])
+    if "post_id" in comment_dict:
+        comment_dict["post_id"] = to_object_id(comment_dict["post_id"])
+    if "replies" in comment_dict:
+        comment_dict["replies"] = [
+            {**reply, "createdAt": to_datetime(reply.get("createdAt")), "author": stored_ref(reply.get("author"))}
+            for reply in comment_dict["replies"]
+        ]
+    return comment_dict
+
+async def comments_for_user(comment_list, current_user) -> list:
+    await authors.hydrate(comment_list)
+    reacted = await reactions_by_user(current_user.id if current_user else None, [c["_id"] for c in comment_list])
     comments = []
-    async for comment in comments_cursor:
-        comments.append(comment_helper(comment))
-    print(f"Found {len(comments)} comments for post_id: {post_id}")
+    for comment in comment_list:
+        comment_dict = comment_helper(comment)
+        comment_dict["likedByMe"] = LIKE in reacted.get(comment_dict["id"], ())
+        comments.append(comment_dict)
     return comments
 
+@router.get("/post/{post_id}", response_model=List[Comment])
+async def list_comments(
+    post_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    replies: int = Query(DEFAULT_INLINE_REPLIES, ge=0, le=MAX_INLINE_REPLIES, description="Replies to inline per comment"),
+    current_user=Depends(get_optional_user),
+):
+    # Oldest first, in thread reading order
+    comment_list, next_cursor = await fetch_page(read_db["comments"], {"post_id": id_match(post_id)}, limit, cursor, projection=comment_projection(replies), direction=1)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    comments = await comments_for_user(comment_list, current_user)
+    logger.debug("Listed comments for post", extra={"post_id": post_id, "count": len(comments)})
+    return fast_response(comments, response)
+
 @router.get("/user/{user_id}", response_model=List[Comment])
-async def list_user_comments(user_id: str):
-    print(f"Fetching comments for user_id: {user_id}")
-    comments_cursor = db["comments"].find({"author._id": user_id})
-    comments = []
-    async for comment in comments_cursor:
-        comments.append(comment_helper(comment))
-    print(f"Found {len(comments)} comments for user_id: {user_id}")
-    return comments
+async def list_user_comments(
+    user_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    replies: int = Query(DEFAULT_INLINE_REPLIES, ge=0, le=MAX_INLINE_REPLIES, description="Replies to inline per comment"),
+    current_user=Depends(get_optional_user),
+):
+    comment_list, next_cursor = await fetch_page(read_db["comments"], {"author._id": id_match(user_id)}, limit, cursor, projection=comment_projection(replies))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    comments = await comments_for_user(comment_list, current_user)
+    logger.debug("Listed comments for user", extra={"user_id": user_id, "count": len(comments)})
+    return fast_response(comments, response)
+
+@router.get("/{comment_id}/replies", response_model=List[Reply])
+async def list_replies(
+    comment_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+):
+    # Replies are embedded in order, so the cursor is simply the next array offset
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    comment = await read_db["comments"].find_one(
+        {"_id": ObjectId(comment_id)},
+        {"replies": {"$slice": [offset, limit]}, "repliesCount": {"$size": {"$ifNull": ["$replies", []]}}}
+    )
+    if not comment:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    replies = comment.get("replies", [])
+    await authors.hydrate(replies)
+    if offset + len(replies) < comment.get("repliesCount", 0):
+        response.headers[NEXT_CURSOR_HEADER] = str(offset + len(replies))
+    return fast_response([reply_helper(reply) for reply in replies], response)
 
 @router.post("", response_model=Comment)
 async def create_comment(comment: Comment, current_user=Depends(get_current_user)):
-    print(f"Received comment data: {comment.dict()}")
     comment_dict = comment.dict(exclude_unset=True)
-    print(f"Comment dict after exclude_unset: {comment_dict}")
+    logger.debug("Creating comment", extra={"post_id": comment_dict.get("post_id"), "user_id": current_user.id})
     # post_id must be present in the body
     if not comment_dict.get("post_id"):
-        print(f"post_id missing from comment_dict: {comment_dict}")
+        logger.info("Rejected comment without post_id", extra={"user_id": current_user.id})
         raise HTTPException(status_code=400, detail="post_id is required in the comment body")
-    result = await db["comments"].insert_one(comment_dict)
-    comment_dict["id"] = str(result.inserted_id)
-    return comment_dict
+    if not ObjectId.is_valid(comment_dict["post_id"]):
+        raise HTTPException(status_code=400, detail="post_id is not a valid id")
+    # Server-computed fields
+    for field in ("likes", "likesCount", "likedByMe", "repliesCount"):
+        comment_dict.pop(field, None)
+    comment_dict["likesCount"] = 0
+    # Counted first, so a missing post is rejected before anything is inserted
+    post = await db["posts"].find_one_and_update(
+        {"_id": ObjectId(comment_dict["post_id"])},
+        {"$inc": {"commentsCount": 1}},
+        projection={"commentsCount": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    try:
+        result = await db["comments"].insert_one(stored_comment(comment_dict))
+    except PyMongoError:
+        await db["posts"].update_one({"_id": post["_id"]}, {"$inc": {"commentsCount": -1}})
+        raise
+    # commentsCount is part of cached post responses
+    await response_cache.bump(response_cache.POSTS)
+    realtime.notify("comments", "insert", result.inserted_id, document=comment_dict)
+    realtime.notify("posts", "update", str(comment_dict["post_id"]), updated={"commentsCount": post.get("commentsCount", 0)})
+    return comment_helper(comment_dict)
 
 @router.put("/{comment_id}", response_model=Comment)
 async def update_comment(comment_id: str, comment: Comment, current_user=Depends(get_current_user)):
-    existing_comment = await db["comments"].find_one({"_id": ObjectId(comment_id)})
-    if not existing_comment:
-        raise HTTPException(status_code=404, detail="Comment not found")
-    if existing_comment.get("author", {}).get("_id") != current_user.id:
-        raise HTTPException(status_code=403, detail="Not allowed to update this comment")
     comment_dict = comment.dict(exclude_unset=True)
-    result = await db["comments"].update_one({"_id": ObjectId(comment_id)}, {"$set": comment_dict})
-    updated_comment = await db["comments"].find_one({"_id": ObjectId(comment_id)})
-    return comment_helper(updated_comment)
+    # Server-computed fields, and post_id: moving a comment would skip both posts' commentsCount
+    for field in ("likes", "likesCount", "likedByMe", "repliesCount", "post_id"):
+        comment_dict.pop(field, None)
+    updated_comment = await db["comments"].find_one_and_update(
+        {"_id": ObjectId(comment_id), "author._id": id_match(current_user.id)},
+        {"$set": stored_comment(comment_dict)},
+        projection={"likes": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated_comment is None:
+        raise await ownership_error(db["comments"], ObjectId(comment_id), "comment", "update")
+    return (await comments_for_user([updated_comment], current_user))[0]
 
 @router.delete("/{comment_id}")
 async def delete_comment(comment_id: str, current_user=Depends(get_current_user)):
-    existing_comment = await db["comments"].find_one({"_id": ObjectId(comment_id)})
-    if not existing_comment:
-        raise HTTPException(status_code=404, detail="Comment not found")
-    if existing_comment.get("author", {}).get("_id") != current_user.id:
-        raise HTTPException(status_code=403, detail="Not allowed to delete this comment")
-    result = await db["comments"].delete_one({"_id": ObjectId(comment_id)})
+    deleted_comment = await db["comments"].find_one_and_delete(
+        {"_id": ObjectId(comment_id), "author._id": id_match(current_user.id)},
+        projection={"post_id": 1},
+    )
+    if deleted_comment is None:
+        raise await ownership_error(db["comments"], ObjectId(comment_id), "comment", "delete")
+    await delete_reactions([ObjectId(comment_id)])
+    if deleted_comment.get("post_id"):
+        post = await db["posts"].find_one_and_update(
+            {"_id": ObjectId(deleted_comment["post_id"])},
+            {"$inc": {"commentsCount": -1}},
+            projection={"commentsCount": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        await response_cache.bump(response_cache.POSTS)
+        if post:
+            realtime.notify("posts", "update", str(deleted_comment["post_id"]), updated={"commentsCount": post.get("commentsCount", 0)})
     return {"message": "Comment deleted"}
 
 @router.post("/{comment_id}/like")
-async def like_comment(comment_id: str, user_id: str = Body(...), current_user=Depends(get_current_user)):
-    comment = await db["comments"].find_one({"_id": ObjectId(comment_id)})
-    if not comment:
+async def like_comment(comment_id: str, current_user=Depends(get_current_user)):
+    result = await toggle_reaction(db["comments"], ObjectId(comment_id), LIKE, current_user.id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Comment not found")
-    likes = comment.get("likes", [])
-    if user_id in likes:
-        likes.remove(user_id)
-    else:
-        likes.append(user_id)
-    await db["comments"].update_one({"_id": ObjectId(comment_id)}, {"$set": {"likes": likes}})
-    return {"likes": likes} 
\ No newline at end of file
+    likes_count, liked = result
+    return {"liked": liked, "likesCount": likes_count}
@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import List
+import asyncio
+import os
+import realtime
+from serialization import dumps
+
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", "15"))
+MAX_SUBSCRIBED_POSTS = 100
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"]
+)
+
+async def event_stream(request: Request, subscriber):
+    try:
+        # Tells EventSource how long to wait before reconnecting
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=REALTIME_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                # Comment line: keeps proxies from closing an idle stream
+                yield b": ping\n\n"
+                continue
+            if event is realtime.CLOSED:
+                return
+            yield b"event: " + event["event"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+    finally:
+        realtime.broker.unsubscribe(subscriber)
+
+@router.get("")
+async def subscribe(
+    request: Request,
+    post_id: List[str] = Query([], description="Posts to receive updates, deletes and new comments for"),
+    category: List[str] = Query([], description="Only push new posts in these categories"),
+):
+    """Server-sent events for new posts and activity on the given posts.
+
+    Without filters the stream carries every new post (a live feed). A client
+    that falls behind gets a final "dropped" event and should reconnect and
+    refetch over REST.
+    """
+    if len(post_id) > MAX_SUBSCRIBED_POSTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_SUBSCRIBED_POSTS} post_id values")
+    subscriber = realtime.broker.subscribe(post_id, category)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many open event streams", headers={"Retry-After": "5"})
+    return StreamingResponse(
+        event_stream(request, subscriber),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
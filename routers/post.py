@@ -1,20 +1,33 @@
-from fastapi import APIRouter, HTTPException, Path, Body, Depends
-from pydantic import BaseModel
-
-# Request model for like/save endpoints
-class UserIdRequest(BaseModel):
-    user_id: str
-from typing import List
+from fastapi import APIRouter, HTTPException, Path, Body, Depends, Query, Request, Response
+from typing import List, Optional
 from models import Post
-from database import db
+from database import db, read_db
 from bson import ObjectId
-from routers.auth import get_current_user
+import logging
+from routers.auth import get_current_user, get_optional_user, ownership_error
+from pymongo import ReturnDocument
+import authors
+from bson_types import id_match, public_ref, stored_ref, to_datetime, to_iso
+import realtime
+import response_cache
+from serialization import fast_response
+import reaction_buffer
+import jobs
+from reactions import LIKE, SAVE, reactions_by_user, reacted_page
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, fetch_page
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/posts",
     tags=["posts"]
 )
 
+# Maintained by the server (comment/reaction handlers), never accepted from clients
+SERVER_FIELDS = ("likes", "saves", "likesCount", "savesCount", "likedByMe", "savedByMe", "commentsCount")
+# Legacy liker arrays are never shipped to clients
+POST_PROJECTION = {"likes": 0, "saves": 0}
+
 def post_helper(post) -> dict:
     return {
         "id": str(post.get("_id")),
@@ -24,114 +37,181 @@ def post_helper(post) -> dict:
         "link": post.get("link"),
         "attachments": post.get("attachments", []),
         "tags": post.get("tags", []),
-        "author": post.get("author"),
-        "createdAt": post.get("createdAt"),
-        "likes": post.get("likes", []),
-        "saves": post.get("saves", []),
-        "comments": post.get("comments", []),
-        # commentsCount will be added dynamically in list_posts
+        "author": public_ref(post.get("author")),
+        "createdAt": to_iso(post.get("createdAt")),
+        "likes": [],
+        "saves": [],
+        # Maintained with $inc by the comment/reaction handlers; see reconcile_counters.py
+        "commentsCount": post.get("commentsCount", 0),
+        "likesCount": post.get("likesCount", 0),
+        "savesCount": post.get("savesCount", 0),
     }
 
+def stored_post(post_dict: dict) -> dict:
+    if "createdAt" in post_dict:
+        post_dict["createdAt"] = to_datetime(post_dict["createdAt"])
+    if "author" in post_dict:
+        post_dict["author"] = stored_ref(post_dict["author"])
+    return post_dict
+
+async def shared_posts(post_list, primary: bool = False) -> list:
+    # The viewer-independent part of a page; one batched users query for fresh author/tag names.
+    # Cached builds pass primary=True: a stale name would be cached under the new version
+    await authors.hydrate(post_list, primary=primary)
+    return [post_helper(post) for post in post_list]
+
+async def with_viewer_flags(posts, current_user) -> list:
+    # Copies, since posts may be shared through the response cache
+    target_ids = [ObjectId(post["id"]) for post in posts]
+    reacted = await reactions_by_user(current_user.id if current_user else None, target_ids)
+    # Toggles still sitting in the write-behind buffer win over what is stored
+    buffered = reaction_buffer.buffer.pending_kinds(current_user.id, target_ids) if current_user else {}
+    result = []
+    for post in posts:
+        kinds = set(reacted.get(post["id"], ()))
+        for kind, active in buffered.get(post["id"], {}).items():
+            if active:
+                kinds.add(kind)
+            else:
+                kinds.discard(kind)
+        result.append({**post, "likedByMe": LIKE in kinds, "savedByMe": SAVE in kinds})
+    return result
+
+async def posts_for_user(post_list, current_user) -> list:
+    return await with_viewer_flags(await shared_posts(post_list), current_user)
+
 @router.get("/", response_model=List[Post])
-async def list_posts():
-    posts_cursor = db["posts"].find()
-    posts = []
-    # Collect all post ids
-    post_list = []
-    async for post in posts_cursor:
-        post_list.append(post)
-    post_ids = [str(post["_id"]) for post in post_list]
-
-    print(f"Found {len(post_ids)} posts: {post_ids}")
-
-    # Get comment counts for all posts in one query
-    comment_counts = {}
-    comments_cursor = db["comments"].aggregate([
-        {"$match": {"post_id": {"$in": post_ids}}},
-        {"$group": {"_id": "$post_id", "count": {"$sum": 1}}}
-    ])
-    async for c in comments_cursor:
-        comment_counts[c["_id"]] = c["count"]
-    
-    print(f"Comment counts: {comment_counts}")
-
-    for post in post_list:
-        post_dict = post_helper(post)
-        post_id = str(post["_id"])
-        post_dict["commentsCount"] = comment_counts.get(post_id, 0)
-        posts.append(post_dict)
-    return posts
+async def list_posts(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    category: Optional[str] = Query(None),
+    author: Optional[str] = Query(None, description="Author user id"),
+    current_user=Depends(get_optional_user),
+):
+    query = {}
+    if category:
+        query["category"] = category
+    if author:
+        query["author._id"] = id_match(author)
+
+    async def build():
+        # From the primary: a lagging secondary's page would be cached (and ETagged) under the new version
+        post_list, next_cursor = await fetch_page(db["posts"], query, limit, cursor, projection=POST_PROJECTION)
+        return await shared_posts(post_list, primary=True), next_cursor
+
+    page = await response_cache.serve(request, response, response_cache.POSTS, build, current_user.id if current_user else None)
+    if isinstance(page, Response):
+        return page
+    posts, next_cursor = page
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    # Built by post_helper, so already in the Post shape; skip re-validating every item
+    return fast_response(await with_viewer_flags(posts, current_user), response)
+
+async def reacted_posts(response: Response, kind: str, limit: int, cursor: Optional[str], current_user):
+    # Paged over the viewer's reactions (read from the primary so a fresh save shows up), then one $in for the posts
+    target_ids, next_cursor = await reacted_page(current_user.id, kind, "posts", limit, cursor)
+    found = {post["_id"]: post async for post in read_db["posts"].find({"_id": {"$in": target_ids}}, POST_PROJECTION)}
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    # Reaction order; reactions whose post is gone are skipped
+    posts = await posts_for_user([found[target_id] for target_id in target_ids if target_id in found], current_user)
+    return fast_response(posts, response)
+
+@router.get("/saved", response_model=List[Post])
+async def list_saved_posts(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    current_user=Depends(get_current_user),
+):
+    return await reacted_posts(response, SAVE, limit, cursor, current_user)
+
+@router.get("/liked", response_model=List[Post])
+async def list_liked_posts(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    current_user=Depends(get_current_user),
+):
+    return await reacted_posts(response, LIKE, limit, cursor, current_user)
 
 @router.post("/", response_model=Post)
 async def create_post(post: Post, current_user=Depends(get_current_user)):
     post_dict = post.dict(exclude_unset=True)
-    result = await db["posts"].insert_one(post_dict)
-    post_dict["id"] = str(result.inserted_id)
-    return post_dict
+    for field in SERVER_FIELDS:
+        post_dict.pop(field, None)
+    post_dict.update({"commentsCount": 0, "likesCount": 0, "savesCount": 0})
+    result = await db["posts"].insert_one(stored_post(post_dict))
+    await response_cache.bump(response_cache.POSTS)
+    realtime.notify("posts", "insert", result.inserted_id, document=post_dict)
+    return post_helper(post_dict)
 
 @router.get("/{post_id}", response_model=Post)
-async def get_post(post_id: str = Path(..., description="The ID of the post to retrieve")):
-    post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    
-    # Get comment count for this post
-    comment_count = await db["comments"].count_documents({"post_id": post_id})
-    
-    post_dict = post_helper(post)
-    post_dict["commentsCount"] = comment_count
-    return post_dict
+async def get_post(request: Request, response: Response, post_id: str = Path(..., description="The ID of the post to retrieve"), current_user=Depends(get_optional_user)):
+    async def build():
+        post = await db["posts"].find_one({"_id": ObjectId(post_id)}, POST_PROJECTION)
+        if not post:
+            raise HTTPException(status_code=404, detail="Post not found")
+        return await shared_posts([post], primary=True)
+
+    posts = await response_cache.serve(request, response, response_cache.POSTS, build, current_user.id if current_user else None)
+    if isinstance(posts, Response):
+        return posts
+    return fast_response((await with_viewer_flags(posts, current_user))[0], response)
 
 @router.put("/{post_id}", response_model=Post)
 async def update_post(post_id: str, post: Post, current_user=Depends(get_current_user)):
-    existing_post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    if not existing_post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    if existing_post.get("author", {}).get("_id") != current_user.id:
-        raise HTTPException(status_code=403, detail="Not allowed to update this post")
     post_dict = post.dict(exclude_unset=True)
-    result = await db["posts"].update_one({"_id": ObjectId(post_id)}, {"$set": post_dict})
-    updated_post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    return post_helper(updated_post)
+    for field in SERVER_FIELDS:
+        post_dict.pop(field, None)
+    # Ownership is part of the filter, so check and write are one atomic round trip
+    updated_post = await db["posts"].find_one_and_update(
+        {"_id": ObjectId(post_id), "author._id": id_match(current_user.id)},
+        {"$set": stored_post(post_dict)},
+        projection=POST_PROJECTION,
+        return_document=ReturnDocument.AFTER,
+    )
+    if updated_post is None:
+        raise await ownership_error(db["posts"], ObjectId(post_id), "post", "update")
+    await response_cache.bump(response_cache.POSTS)
+    realtime.notify("posts", "update", post_id, updated=post_dict)
+    return (await posts_for_user([updated_post], current_user))[0]
 
 @router.delete("/{post_id}")
 async def delete_post(post_id: str, current_user=Depends(get_current_user)):
-    existing_post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    if not existing_post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    if existing_post.get("author", {}).get("_id") != current_user.id:
-        raise HTTPException(status_code=403, detail="Not allowed to delete this post")
-    result = await db["posts"].delete_one({"_id": ObjectId(post_id)})
+    deleted = await db["posts"].find_one_and_delete({"_id": ObjectId(post_id), "author._id": id_match(current_user.id)}, projection={"_id": 1})
+    if deleted is None:
+        raise await ownership_error(db["posts"], ObjectId(post_id), "post", "delete")
+    reaction_buffer.buffer.discard(ObjectId(post_id))
+    # Comments and reactions can number in the thousands; removed in the background
+    await jobs.enqueue("cascade_post", post_id=post_id)
+    await response_cache.bump(response_cache.POSTS)
+    realtime.notify("posts", "delete", post_id)
     return {"message": "Post deleted"}
 
 @router.post("/{post_id}/like")
-async def like_post(post_id: str, req: UserIdRequest, current_user=Depends(get_current_user)):
-    post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    if not post:
+async def like_post(post_id: str, current_user=Depends(get_current_user)):
+    result = await reaction_buffer.toggle(db["posts"], ObjectId(post_id), LIKE, current_user.id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    likes = post.get("likes", [])
-    user_id = req.user_id
-    if user_id in likes:
-        likes.remove(user_id)
-    else:
-        likes.append(user_id)
-    await db["posts"].update_one({"_id": ObjectId(post_id)}, {"$set": {"likes": likes}})
-    return {"likes": likes}
+    if not reaction_buffer.REACTION_BUFFER_ENABLED:
+        # Buffered toggles bump the cache version once per flush instead
+        await response_cache.bump(response_cache.POSTS)
+    likes_count, liked = result
+    realtime.notify("posts", "update", post_id, updated={"likesCount": likes_count})
+    return {"liked": liked, "likesCount": likes_count}
 
 @router.post("/{post_id}/save")
-async def save_post(post_id: str, req: UserIdRequest, current_user=Depends(get_current_user)):
-    print(f"Save request - post_id: {post_id}, user_id: {req.user_id}, current_user: {current_user.id}")
-    post = await db["posts"].find_one({"_id": ObjectId(post_id)})
-    if not post:
+async def save_post(post_id: str, current_user=Depends(get_current_user)):
+    result = await reaction_buffer.toggle(db["posts"], ObjectId(post_id), SAVE, current_user.id)
+    if result is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    saves = post.get("saves", [])
-    user_id = req.user_id
-    print(f"Current saves: {saves}, user_id: {user_id}")
-    if user_id in saves:
-        saves.remove(user_id)
-        print(f"Removed user from saves: {saves}")
-    else:
-        saves.append(user_id)
-        print(f"Added user to saves: {saves}")
-    await db["posts"].update_one({"_id": ObjectId(post_id)}, {"$set": {"saves": saves}})
-    return {"saves": saves}
\ No newline at end of file
+    if not reaction_buffer.REACTION_BUFFER_ENABLED:
+        await response_cache.bump(response_cache.POSTS)
+    saves_count, saved = result
+    realtime.notify("posts", "update", post_id, updated={"savesCount": saves_count})
+    logger.debug("Toggled save", extra={"post_id": post_id, "user_id": current_user.id, "saved": saved})
+    return {"saved": saved, "savesCount": saves_count}
@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, Query, Response
+from typing import List, Optional
+from models import SearchResult
+from database import read_db
+from routers.auth import get_optional_user
+from routers.post import POST_PROJECTION, posts_for_user
+from routers.comment import comments_for_user
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, encode_cursor, keyset_filter
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+SEARCH_TYPES = ("all", "posts", "comments")
+
+async def text_search(collection: str, q: str, filters: dict, limit: int, cursor: Optional[str], projection: dict) -> list:
+    # Ranked by textScore, then _id, so the (score, _id) keyset cursor is stable across pages
+    pipeline = [
+        {"$match": {"$text": {"$search": q}, **filters}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+    ]
+    if cursor:
+        pipeline.append({"$match": keyset_filter(cursor, "score")})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": -1}},
+        {"$limit": limit + 1},
+        {"$project": projection},
+    ]
+    return await read_db[collection].aggregate(pipeline).to_list(length=limit + 1)
+
+@router.get("", response_model=List[SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=2, description="Words or \"quoted phrases\" to search for"),
+    type: str = Query("all", enum=list(SEARCH_TYPES)),
+    category: Optional[str] = Query(None, description="Only search posts in this category (comments are skipped)"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    current_user=Depends(get_optional_user),
+):
+    hits = []
+    if type in ("all", "posts"):
+        filters = {"category": category} if category else {}
+        for doc in await text_search("posts", q, filters, limit, cursor, POST_PROJECTION):
+            hits.append(("post", doc))
+    if type in ("all", "comments") and not category:
+        for doc in await text_search("comments", q, {}, limit, cursor, {"likes": 0}):
+            hits.append(("comment", doc))
+
+    # Both result sets are ordered by (score, _id) desc, so merging them keeps the cursor valid
+    hits.sort(key=lambda hit: (hit[1]["score"], hit[1]["_id"]), reverse=True)
+    if len(hits) > limit:
+        hits = hits[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(hits[-1][1], "score")
+
+    posts = await posts_for_user([doc for kind, doc in hits if kind == "post"], current_user)
+    comments = await comments_for_user([doc for kind, doc in hits if kind == "comment"], current_user)
+    posts_by_id = {p["id"]: p for p in posts}
+    comments_by_id = {c["id"]: c for c in comments}
+    results = []
+    for kind, doc in hits:
+        doc_id = str(doc["_id"])
+        if kind == "post":
+            results.append({"type": kind, "score": doc["score"], "post": posts_by_id[doc_id]})
+        else:
+            results.append({"type": kind, "score": doc["score"], "comment": comments_by_id[doc_id]})
+    return results
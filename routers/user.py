@@ -1,9 +1,21 @@
-from fastapi import APIRouter, HTTPException, Path, Query
-from typing import List
-from models import User, CreateUser, AuthUser
-from database import db
+from fastapi import APIRouter, HTTPException, Path, Query, Depends, Response
+from typing import List, Optional
+from models import User, CreateUser, AuthUser, Post
+from database import db, read_db
 from bson import ObjectId
-from routers.auth import get_password_hash
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import logging
+from routers.auth import UPDATE_ATTEMPTS, get_password_hash, invalidate_user_cache, get_current_user, get_optional_user, duplicate_user_error
+from routers.post import POST_PROJECTION, posts_for_user
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, fetch_page
+from serialization import fast_response
+from bson_types import id_match, to_datetime
+import jobs
+import response_cache
+from user_search import MAX_CANDIDATES, prefix_query, rank, search_terms
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/users",
@@ -18,9 +30,14 @@ def user_helper(user) -> dict:
         "full_name": user.get("full_name"),
     }
 
+def require_self(user_id: str, current_user: AuthUser, action: str):
+    # Renames fan out to every post and deletes cascade to all of the user's content
+    if current_user.id != user_id:
+        raise HTTPException(status_code=403, detail=f"Not allowed to {action} this user")
+
 @router.get("/", response_model=List[User])
 async def list_users():
-    users_cursor = db["users"].find()
+    users_cursor = read_db["users"].find()
     users = []
     async for user in users_cursor:
         users.append(user_helper(user))
@@ -28,42 +45,40 @@ async def list_users():
 
 @router.get("/search", response_model=List[dict])
 async def search_users(q: str = Query(..., description="Search query (username or full_name)")):
-    """Search users by username or full_name"""
-    print(f"Searching users with query: {q}")
+    """Typeahead search: prefix match on username, full name or any word of it"""
     if not q or len(q.strip()) < 2:
-        print("Query too short, returning empty results")
         return []
     
     search_query = q.strip()
-    # Search by username or full_name (case insensitive)
-    users_cursor = db["users"].find({
-        "$or": [
-            {"username": {"$regex": search_query, "$options": "i"}},
-            {"full_name": {"$regex": search_query, "$options": "i"}}
-        ]
-    }).limit(10)  # Limit results to 10
+    # Anchored regex on the normalized search_terms keys is an index range scan
+    candidates = await read_db["users"].find(
+        prefix_query(search_query),
+        {"username": 1, "full_name": 1}
+    ).limit(MAX_CANDIDATES).to_list(length=MAX_CANDIDATES)
+    candidates.sort(key=lambda user: rank(user, search_query))
     
     users = []
-    async for user in users_cursor:
+    for user in candidates[:10]:  # Limit results to 10
         users.append({
             "_id": str(user.get("_id")),
             "name": user.get("full_name") or user.get("username"),
             "username": user.get("username")
         })
     
-    print(f"Found {len(users)} users for query '{search_query}': {users}")
+    logger.debug("User search", extra={"query": search_query, "count": len(users)})
     return users
 
 @router.post("/", response_model=AuthUser)
 async def create_user(user: CreateUser):
-    # Check for duplicate username/email
-    if await db["users"].find_one({"username": user.username}):
-        raise HTTPException(status_code=400, detail="Username already registered")
-    if await db["users"].find_one({"email": user.email}):
-        raise HTTPException(status_code=400, detail="Email already registered")
     user_dict = user.dict()
-    user_dict["password"] = get_password_hash(user.password)
-    result = await db["users"].insert_one(user_dict)
+    user_dict["password"] = await get_password_hash(user.password)
+    user_dict["search_terms"] = search_terms(user.username, user.full_name)
+    user_dict["joined"] = to_datetime(user_dict.get("joined"))
+    # Duplicate username/email are rejected by the unique indexes
+    try:
+        result = await db["users"].insert_one(user_dict)
+    except DuplicateKeyError as e:
+        raise duplicate_user_error(e)
     user_dict["id"] = str(result.inserted_id)
     return AuthUser(
         id=user_dict["id"],
@@ -78,18 +93,58 @@ async def get_user(user_id: str = Path(..., description="The ID of the user to r
         raise HTTPException(status_code=404, detail="User not found")
     return user_helper(user)
 
+@router.get("/{user_id}/posts", response_model=List[Post])
+async def list_user_posts(
+    user_id: str,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    current_user=Depends(get_optional_user),
+):
+    # Served by the author_createdAt_id index
+    post_list, next_cursor = await fetch_page(read_db["posts"], {"author._id": id_match(user_id)}, limit, cursor, projection=POST_PROJECTION)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return fast_response(await posts_for_user(post_list, current_user), response)
+
 @router.put("/{user_id}", response_model=User)
-async def update_user(user_id: str, user: User):
+async def update_user(user_id: str, user: User, current_user: AuthUser = Depends(get_current_user)):
+    require_self(user_id, current_user, "update")
     user_dict = user.dict(exclude_unset=True)
-    result = await db["users"].update_one({"_id": ObjectId(user_id)}, {"$set": user_dict})
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="User not found")
-    updated_user = await db["users"].find_one({"_id": ObjectId(user_id)})
+    # Two round trips: search_terms need the stored full_name, and their accent folding
+    # cannot be done in an update pipeline. The write is conditional on the full_name
+    # they were built from, so a concurrent profile edit means another try
+    for _ in range(UPDATE_ATTEMPTS):
+        current = await db["users"].find_one({"_id": ObjectId(user_id)}, {"username": 1, "full_name": 1})
+        if current is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_dict["search_terms"] = search_terms(user.username, current.get("full_name"))
+        try:
+            updated_user = await db["users"].find_one_and_update(
+                {"_id": current["_id"], "full_name": current.get("full_name")},
+                {"$set": user_dict},
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError as e:
+            raise duplicate_user_error(e)
+        if updated_user is not None:
+            break
+    else:
+        raise HTTPException(status_code=409, detail="User was modified concurrently, try again")
+    invalidate_user_cache(user_id)
+    if updated_user["username"] != current["username"]:
+        await jobs.enqueue("propagate_author_name", user_id=user_id)
+        # Users without a full_name are shown by username in cached post responses
+        await response_cache.bump(response_cache.POSTS)
     return user_helper(updated_user)
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: str):
+async def delete_user(user_id: str, current_user: AuthUser = Depends(get_current_user)):
+    require_self(user_id, current_user, "delete")
     result = await db["users"].delete_one({"_id": ObjectId(user_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user_cache(user_id)
+    await jobs.enqueue("cascade_user", user_id=user_id)
+    await response_cache.bump(response_cache.POSTS)
     return {"message": "User deleted"} 
\ No newline at end of file
@@ -1,13 +1,17 @@
 
+import argparse
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
-from datetime import datetime
-from dotenv import load_dotenv
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from bson import ObjectId
 from passlib.context import CryptContext
-
-
-load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
+import database
+from database import db
+from bson_types import to_datetime, to_object_id
+from indexes import ensure_indexes
+from user_search import search_terms
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -232,78 +236,132 @@ mockPosts = [
     }
 ]
 
-MONGODB_URI = os.getenv("MONGODB_URI")
-DB_NAME = os.getenv("DB_NAME")
+FIXTURE_PASSWORD = "testpassword"
+CHUNK_SIZE = 1000
+# insert_many calls in flight per collection
+LOAD_CONCURRENCY = 4
 
-client = AsyncIOMotorClient(MONGODB_URI)
-db = client[DB_NAME]
 
+def _hash_password(password):
+    return pwd_context.hash(password)
 
-async def seed():
-    # Remove old data before seeding
-    await db['users'].delete_many({})
-    await db['posts'].delete_many({})
-    await db['comments'].delete_many({})
 
-    users_by_name = {}
-    # 1. Create users (authors and comment authors) with auto-generated _id and hashed password
-    for post in mockPosts:
-        author = post['author']
-        author_key = author['name'].strip().lower()
-        if author_key not in users_by_name:
-            hashed_password = pwd_context.hash("testpassword")
-            from datetime import datetime, timedelta, timezone
-            ist = timezone(timedelta(hours=5, minutes=30))
-            user_doc = {
-                "username": author['name'].replace(' ', '').lower(),
-                "email": f"{author['name'].replace(' ', '').lower()}@example.com",
-                "full_name": author['name'],
-                "password": hashed_password,
-                "joined": datetime.now(ist).isoformat()
-            }
-            result = await db['users'].insert_one(user_doc)
-            users_by_name[author_key] = str(result.inserted_id)
-        for comment in post.get('comments', []):
-            c_author = comment['author']
-            c_key = c_author['name'].strip().lower()
-            if c_key not in users_by_name:
-                hashed_password = pwd_context.hash("testpassword")
-                from datetime import datetime, timedelta, timezone
-                ist = timezone(timedelta(hours=5, minutes=30))
-                user_doc = {
-                    "username": c_author['name'].replace(' ', '').lower(),
-                    "email": f"{c_author['name'].replace(' ', '').lower()}@example.com",
-                    "full_name": c_author['name'],
-                    "password": hashed_password,
-                    "joined": datetime.now(ist).isoformat()
-                }
-                result = await db['users'].insert_one(user_doc)
-                users_by_name[c_key] = str(result.inserted_id)
+class Progress:
+    def __init__(self, totals):
+        self.totals = totals
+        self.done = {name: 0 for name in totals}
+        self.started = time.perf_counter()
+
+    def add(self, name, count):
+        self.done[name] += count
+        elapsed = time.perf_counter() - self.started
+        parts = " ".join(f"{n} {self.done[n]}/{t}" for n, t in self.totals.items())
+        print(f"\r{parts} ({sum(self.done.values()) / elapsed:,.0f} docs/s)", end="", flush=True)
 
-    # 2. Insert posts and comments with correct user references
+
+def username_for(name, copy):
+    base = name.replace(' ', '').lower()
+    return base if copy == 0 else f"{base}{copy}"
+
+
+def fixture_names():
+    names = []
     for post in mockPosts:
-        post_doc = post.copy()
-        comments = post_doc.pop('comments', [])
-        post_doc.pop('_id', None)
-        # Update author _id to real MongoDB _id
-        author_key = post_doc['author']['name'].strip().lower()
-        post_doc['author']['_id'] = users_by_name[author_key]
-        # Update tags if present
-        if 'tags' in post_doc:
-            for tag in post_doc['tags']:
-                tag_key = tag['name'].strip().lower()
-                tag['_id'] = users_by_name.get(tag_key, tag.get('_id'))
-        result = await db['posts'].insert_one(post_doc)
-        post_id = str(result.inserted_id)
-        for comment in comments:
-            comment_doc = comment.copy()
-            comment_doc['post_id'] = post_id
-            comment_doc.pop('_id', None)
-            # Update comment author _id
-            c_key = comment_doc['author']['name'].strip().lower()
-            comment_doc['author']['_id'] = users_by_name[c_key]
-            await db['comments'].insert_one(comment_doc)
-    print('Seeding complete!')
+        for person in [post['author']] + [c['author'] for c in post.get('comments', [])] + post.get('tags', []):
+            if person['name'] not in names:
+                names.append(person['name'])
+    return names
+
+
+def build_documents(scale, hashes):
+    """Expand mockPosts `scale` times into ready-to-insert documents with pre-assigned ids."""
+    names = fixture_names()
+    joined = datetime.now(timezone.utc)
+    users, posts, comments, reactions = [], [], [], []
+    for n in range(scale):
+        ids = {}
+        for name in names:
+            username = username_for(name, n)
+            user_id = ObjectId()
+            ids[name.strip().lower()] = str(user_id)
+            users.append({
+                "_id": user_id,
+                "username": username,
+                "email": f"{username}@example.com",
+                "full_name": name,
+                "password": hashes[len(users) % len(hashes)],
+                "joined": joined,
+                "search_terms": search_terms(username, name),
+            })
+        for post in mockPosts:
+            post_doc = copy.deepcopy(post)
+            post_comments = post_doc.pop('comments', [])
+            likes = post_doc.pop('likes', [])
+            post_doc.pop('_id', None)
+            post_doc['_id'] = ObjectId()
+            post_doc['commentsCount'] = len(post_comments)
+            post_doc['likesCount'] = len(likes)
+            post_doc['savesCount'] = 0
+            post_doc['createdAt'] = to_datetime(post_doc['createdAt'])
+            post_doc['author']['_id'] = to_object_id(ids[post_doc['author']['name'].strip().lower()])
+            for tag in post_doc.get('tags', []):
+                tag['_id'] = ids.get(tag['name'].strip().lower(), tag.get('_id'))
+            posts.append(post_doc)
+            for user_id in likes:
+                reactions.append({'user_id': user_id, 'target': post_doc['_id'], 'kind': 'like', 'createdAt': datetime.now(timezone.utc)})
+            for comment in post_comments:
+                comment.pop('_id', None)
+                comment['post_id'] = post_doc['_id']
+                comment['createdAt'] = to_datetime(comment['createdAt'])
+                comment['likesCount'] = 0
+                comment['author']['_id'] = to_object_id(ids[comment['author']['name'].strip().lower()])
+                comments.append(comment)
+    return {"users": users, "posts": posts, "comments": comments, "reactions": reactions}
+
+
+async def load(collection, docs, progress):
+    sem = asyncio.Semaphore(LOAD_CONCURRENCY)
+
+    async def insert(chunk):
+        async with sem:
+            await db[collection].insert_many(chunk, ordered=False)
+        progress.add(collection, len(chunk))
+
+    await asyncio.gather(*(insert(docs[i:i + CHUNK_SIZE]) for i in range(0, len(docs), CHUNK_SIZE)))
+
+
+async def password_hashes(count, unique):
+    if not unique:
+        # Every fixture user has the same password, so one bcrypt round is enough
+        return [_hash_password(FIXTURE_PASSWORD)]
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor() as pool:
+        return await asyncio.gather(*(loop.run_in_executor(pool, _hash_password, FIXTURE_PASSWORD) for _ in range(count)))
+
+
+async def seed(scale=1, drop=False, unique_hashes=False):
+    if drop:
+        for collection in ("users", "posts", "comments", "reactions"):
+            await db[collection].drop()
+    elif await db['users'].find_one({"username": username_for(mockPosts[0]['author']['name'], 0)}):
+        raise SystemExit("Seed users already exist; re-run with --drop to replace them")
+
+    hashes = await password_hashes(len(fixture_names()) * scale, unique_hashes)
+    docs = build_documents(scale, hashes)
+    progress = Progress({name: len(items) for name, items in docs.items()})
+    # References are pre-assigned ObjectIds, so all collections can load at once
+    await asyncio.gather(*(load(name, items, progress) for name, items in docs.items()))
+    print()
+    await ensure_indexes(db)
+    elapsed = time.perf_counter() - progress.started
+    total = sum(progress.done.values())
+    print(f'Seeding complete! {total} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)')
+    database.close()
 
 if __name__ == "__main__":
-    asyncio.run(seed()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed the database with the mock posts")
+    parser.add_argument("--scale", type=int, default=1, help="Number of copies of the mock dataset (users get numeric suffixes)")
+    parser.add_argument("--drop", action="store_true", help="Drop users/posts/comments/reactions first")
+    parser.add_argument("--unique-hashes", action="store_true", help="bcrypt every user separately in a process pool instead of sharing one hash")
+    args = parser.parse_args()
+    asyncio.run(seed(args.scale, args.drop, args.unique_hashes))
@@ -0,0 +1,44 @@
+import json
+from datetime import date, datetime
+from bson import ObjectId
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback; same output, just slower
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response that encodes ObjectIds and datetimes from Mongo documents directly."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def fast_response(content, response: Response = None, status_code: int = 200) -> FastJSONResponse:
+    """Serialize trusted, already-shaped data without response_model validation.
+
+    FastAPI ignores headers set on the injected Response once a handler returns
+    its own, so they are carried over here.
+    """
+    fast = FastJSONResponse(content, status_code=status_code)
+    if response is not None:
+        for name, value in response.raw_headers:
+            if name != b"content-length":
+                fast.raw_headers.append((name, value))
+    return fast
@@ -0,0 +1,65 @@
+import asyncio
+import re
+import unicodedata
+from pymongo import UpdateOne
+
+MAX_CANDIDATES = 50
+_REGEX_SPECIAL = re.compile(r"([.^$*+?()\[\]{}|\\])")
+
+
+def normalize(text) -> str:
+    # Lowercase, strip accents and collapse whitespace so "José  Díaz" matches "jose d"
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.lower().split())
+
+
+def search_terms(username, full_name) -> list:
+    """Normalized keys stored on each user; an anchored regex on them can use the index."""
+    terms = set()
+    for value in (username, full_name):
+        value = normalize(value)
+        if value:
+            terms.add(value)
+            terms.update(value.split(" "))
+    return sorted(terms)
+
+
+def prefix_query(q: str) -> dict:
+    return {"search_terms": {"$regex": "^" + _REGEX_SPECIAL.sub(r"\\\1", normalize(q))}}
+
+
+def rank(user, q: str) -> tuple:
+    q = normalize(q)
+    username = normalize(user.get("username"))
+    full_name = normalize(user.get("full_name"))
+    if username == q:
+        score = 0
+    elif username.startswith(q):
+        score = 1
+    elif full_name.startswith(q):
+        score = 2
+    else:
+        score = 3
+    return score, len(username), username
+
+
+async def backfill(db, batch_size: int = 1000):
+    """Populate search_terms for users created before it existed."""
+    updated = 0
+    while True:
+        batch = await db["users"].find({"search_terms": {"$exists": False}}, {"username": 1, "full_name": 1}).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        await db["users"].bulk_write([
+            UpdateOne({"_id": u["_id"]}, {"$set": {"search_terms": search_terms(u.get("username"), u.get("full_name"))}})
+            for u in batch
+        ], ordered=False)
+        updated += len(batch)
+        print(f"Backfilled search_terms for {updated} users")
+    return updated
+
+
+if __name__ == "__main__":
+    from database import db
+    asyncio.run(backfill(db))